@@ -17,25 +17,19 @@ import signal
 import string
 import subprocess
 import sys
-import yaml
 
-from m2ee import pgutil, M2EE, client_errno
+from m2ee import client_errno
 import m2ee
 
 logger = logging
 
-if not sys.stdout.isatty():
-    import codecs
-    import locale
-    sys.stdout = codecs.getwriter(locale.getpreferredencoding())(sys.stdout)
-
 
 class CLI(cmd.Cmd, object):
 
     def __init__(self, yaml_files=None, yolo_mode=False):
         logger.debug('Using m2ee-tools version %s' % m2ee.__version__)
         cmd.Cmd.__init__(self)
-        self.m2ee = M2EE(yaml_files=yaml_files)
+        self.m2ee = m2ee.M2EE(yaml_files=yaml_files)
         self.yolo_mode = yolo_mode
         self.prompt_username = pwd.getpwuid(os.getuid())[0]
         self._default_prompt = "m2ee(%s): " % self.prompt_username
@@ -43,18 +37,76 @@ class CLI(cmd.Cmd, object):
         self.nodetach = False
 
     def do_restart(self, args):
-        if self._stop():
-            self._start()
+        # Hold the lock in between, so that a running supervisor does not
+        # start the application while it's down.
+        with self.m2ee.lifecycle_lock():
+            if self._stop():
+                self._start()
 
     def do_stop(self, args):
         self._stop()
 
+    def do_bluegreen_restart(self, args):
+        if self.m2ee.config.slot is None:
+            logger.error("Blue/green restarts are not configured. See the blue_green "
+                         "section in the m2ee configuration documentation.")
+            return
+        active = self.m2ee
+        self.m2ee = active.get_standby()
+        switched = False
+        try:
+            switched = self._start_standby()
+        finally:
+            if not switched:
+                self.m2ee = active
+        if not switched:
+            logger.info("The application in the %s slot is still handling all "
+                        "traffic." % active.config.slot)
+            return
+
+        standby = self.m2ee
+        self.m2ee = active
+        try:
+            logger.info("Stopping the application in the %s slot..." % active.config.slot)
+            self._stop(
+                drain_timeout=active.config.get_blue_green_options().get('drain_timeout', 30))
+        finally:
+            self.m2ee = standby
+
+    def _start_standby(self):
+        standby = self.m2ee
+        slot = standby.config.slot
+        if standby.runner.check_pid() or standby.client.ping():
+            logger.info("There's still an application process running in the %s "
+                        "slot, stopping it first." % slot)
+            if not self._stop():
+                return False
+        logger.info("Starting the application in the %s slot, using runtime port %s..." %
+                    (slot, standby.config.get_runtime_port()))
+        if self._start() != 'started':
+            logger.error("Starting the application in the %s slot did not succeed." % slot)
+            return False
+        options = standby.config.get_blue_green_options()
+        if not standby.wait_until_healthy(options.get('health_timeout', 60)):
+            logger.error("The application in the %s slot did not become healthy in "
+                         "time, stopping it again." % slot)
+            self._stop()
+            return False
+        if not standby.activate():
+            self._stop()
+            return False
+        return True
+
     def do_start(self, args):
         self._start()
 
-    def _stop(self):
+    def _stop(self, drain_timeout=None):
+        with self.m2ee.lifecycle_lock():
+            return self._stop_application(drain_timeout)
+
+    def _stop_application(self, drain_timeout=None):
         logger.debug("Trying to stop the application.")
-        stopped = self.m2ee.stop()
+        stopped = self.m2ee.stop(drain_timeout=drain_timeout)
         if stopped:
             return True
 
@@ -98,7 +150,15 @@ class CLI(cmd.Cmd, object):
         Starting the Mendix Runtime can fail in both a temporary or permanent
         way. See the client_errno for possible error codes.
         """
+        result = 'failed'
+        with self.m2ee.lifecycle_lock():
+            try:
+                result = self._start_sequence()
+            finally:
+                self.m2ee.save_startup_profile(result)
+        return result
 
+    def _start_sequence(self):
         if not self.m2ee.config.all_systems_are_go():
             raise m2ee.exceptions.M2EEException(
                 "The application cannot be started because no application "
@@ -120,7 +180,7 @@ class CLI(cmd.Cmd, object):
             logger.error("Sending configuration failed: %s" % e.cause)
             logger.error("You'll have to fix the configuration and run start again...")
             self._stop()
-            return
+            return 'aborted'
 
         abort = False
         fully_started = False
@@ -136,10 +196,12 @@ class CLI(cmd.Cmd, object):
                         # This call tries to create a database and immediately execute
                         # ddl commands.
                         self.m2ee.client.execute_ddl_commands()
+                        self.m2ee.startup_profile.mark('ddl_commands')
                     else:
                         abort = True
                 elif e.result == client_errno.start_INVALID_DB_STRUCTURE:
                     answer = self._handle_ddl_commands()
+                    self.m2ee.startup_profile.mark('ddl_commands')
                     if answer == 'a':
                         abort = True
                 elif e.result == client_errno.start_MISSING_MF_CONSTANT:
@@ -160,6 +222,14 @@ class CLI(cmd.Cmd, object):
 
         if abort:
             self._stop()
+            return 'aborted'
+
+        warm_up = self.m2ee.warm_up()
+        if warm_up is not None:
+            logger.info("Warm-up done, %s successful requests in %.1fs:" %
+                        (warm_up.total(), warm_up.duration))
+            print('\n'.join(warm_up.report()))
+        return 'started'
 
     def _handle_ddl_commands(self):
         feedback = self.m2ee.client.get_ddl_commands({"verbose": True})
@@ -325,11 +395,98 @@ class CLI(cmd.Cmd, object):
             logger.error("Unexpected health check status: %s" % feedback['health'])
 
     def do_statistics(self, args):
+        import yaml
         stats = self.m2ee.client.runtime_statistics()
         stats.update(self.m2ee.client.server_statistics())
         print(yaml.safe_dump(stats, default_flow_style=False))
 
+    def do_client_stats(self, args):
+        stats = self.m2ee.client.request_statistics.get()
+        if len(stats) == 0:
+            logger.info("No admin API requests have been done by this m2ee process yet.")
+            return
+        percentile = m2ee.client.M2EEClientStatistics.percentile
+        buckets = m2ee.client.M2EEClientStatistics.buckets
+
+        def ms(seconds):
+            return "-" if seconds is None else "%d" % round(seconds * 1000)
+
+        print("%-32s %6s %6s %8s %8s %8s %8s %8s %8s" %
+              ("action", "count", "errors", "timeouts", "avg ms", "p50 ms", "p90 ms",
+               "p99 ms", "max ms"))
+        for action in sorted(stats.keys()):
+            action_stats = stats[action]
+            histogram = action_stats['histogram']
+            completed = action_stats['count'] - action_stats['timeouts']
+            print("%-32s %6s %6s %8s %8s %8s %8s %8s %8s" % (
+                action,
+                action_stats['count'],
+                action_stats['errors'],
+                action_stats['timeouts'],
+                ms(action_stats['total'] / completed if completed else None),
+                ms(percentile(histogram, 50)),
+                ms(percentile(histogram, 90)),
+                ms(percentile(histogram, 99)),
+                ms(action_stats['max'] if completed else None),
+            ))
+        if args == 'histogram':
+            for action in sorted(stats.keys()):
+                print("%s:" % action)
+                for i, count in enumerate(stats[action]['histogram']):
+                    if count == 0:
+                        continue
+                    if i < len(buckets):
+                        print("  <= %6s ms: %s" % (ms(buckets[i]), count))
+                    else:
+                        print("   > %6s ms: %s" % (ms(buckets[-1]), count))
+
+    def do_startup_profile(self, args):
+        profiles = self.m2ee.get_startup_profiles()
+        if len(profiles) == 0:
+            logger.info("No startup profiles have been recorded yet.")
+            return
+        recent = profiles[-5:]
+
+        # Phases can occur more than once, e.g. start, when the database
+        # structure had to be updated first. Phases are listed in the order
+        # of the most recent start.
+        durations = []
+        phases = []
+        for profile in reversed(profiles):
+            profile_durations = {}
+            for phase, seconds in profile.durations():
+                profile_durations[phase] = profile_durations.get(phase, 0) + seconds
+                if phase not in phases:
+                    phases.append(phase)
+            profile_durations['total'] = profile.total()
+            durations.insert(0, profile_durations)
+        phases.append('total')
+
+        def median(values):
+            values = sorted(values)
+            middle = len(values) // 2
+            if len(values) % 2 == 1:
+                return values[middle]
+            return (values[middle - 1] + values[middle]) / 2
+
+        print("Duration of startup phases in seconds, for the last %s of %s recorded "
+              "starts, and the median of all of them:" % (len(recent), len(profiles)))
+        print("%-24s%s %12s" % (
+            "phase",
+            "".join(["%12s" % datetime.datetime.fromtimestamp(profile.started)
+                     .strftime("%m-%d %H:%M") for profile in recent]),
+            "median"))
+        for phase in phases:
+            print("%-24s%s %12.2f" % (
+                phase,
+                "".join(["%12.2f" % profile_durations[phase]
+                         if phase in profile_durations else "%12s" % "-"
+                         for profile_durations in durations[-len(recent):]]),
+                median([d[phase] for d in durations if phase in d])))
+        print("%-24s%s" % ("result", "".join(["%12s" % profile.result for profile in recent])))
+
     def do_show_cache_statistics(self, args):
+        import yaml
         stats = self.m2ee.client.cache_statistics()
         print(yaml.safe_dump(stats, default_flow_style=False))
 
@@ -349,7 +506,21 @@ class CLI(cmd.Cmd, object):
         logger.info("The nagios plugin will exit m2ee after running, this is "
                     "by design, don't report it as bug.")
         # TODO: implement as separate program after libraryfying m2ee
-        sys.exit(m2ee.nagios.check(self.m2ee.runner, self.m2ee.client))
+        sys.exit(m2ee.nagios.check(self.m2ee.runner, self.m2ee.client,
+                                   self.m2ee.config.get_nagios_options()))
+
+    def do_supervise(self, args):
+        logger.info("The supervisor keeps running until it receives SIGTERM or "
+                    "<ctrl>-c, and restarts the application when it crashed. "
+                    "After using stop in another m2ee session, it waits until "
+                    "the application is started again.")
+        m2ee.supervisor.Supervisor(self.m2ee, self._start,
+                                   self.m2ee.config.get_supervise_options()).run()
+
+    def do_agent(self, args):
+        logger.info("The agent keeps running until it receives SIGTERM or "
+                    "<ctrl>-c. Use m2ee --via-agent to let it execute commands.")
+        m2ee.agent.Agent(self, self.m2ee.config.get_agent_options()).run()
 
     def do_about(self, args):
         print('Using m2ee-tools version %s' % m2ee.__version__)
@@ -361,6 +532,7 @@ class CLI(cmd.Cmd, object):
                 print('Model version: %s' % feedback['model_version'])
 
     def do_show_license_information(self, args):
+        import yaml
         feedback = self.m2ee.client.get_license_information()
         if 'license' in feedback:
             logger.debug(yaml.safe_dump(feedback['license'],
@@ -395,6 +567,7 @@ class CLI(cmd.Cmd, object):
                 self._print_license_limitation(limitation, separate_anonymous)
 
         if len(licensecopy) > 1:
+            import yaml
             print(yaml.safe_dump(licensecopy, allow_unicode=True))
 
     def _print_license_limitation(self, limitation, separate_anonymous):
@@ -523,7 +696,10 @@ class CLI(cmd.Cmd, object):
         self.m2ee.reload_config()
 
     def do_dump_config(self, args):
-        self.m2ee.config.dump()
+        if args not in ('', 'origin'):
+            logger.error("Unknown argument %s, use dump_config [origin]" % args)
+            return
+        self.m2ee.config.dump(origin=(args == 'origin'))
 
     def do_set_database_password(self, args):
         password = getpass.getpass("Database password: ")
@@ -533,18 +709,22 @@ class CLI(cmd.Cmd, object):
         if not self.m2ee.config.is_using_postgresql():
             logger.error("Only PostgreSQL databases are supported right now.")
             return
-        pgutil.psql(self.m2ee.config)
+        m2ee.pgutil.psql(self.m2ee.config)
 
     def do_dumpdb(self, args):
         if not self.m2ee.config.is_using_postgresql():
             logger.error("Only PostgreSQL databases are supported right now.")
             return
         if len(args) > 0:
-            pgutil.dumpdb(self.m2ee.config, args)
+            m2ee.pgutil.dumpdb(self.m2ee.config, args)
         else:
-            pgutil.dumpdb(self.m2ee.config)
+            m2ee.pgutil.dumpdb(self.m2ee.config)
 
     def do_restoredb(self, args):
+        with self.m2ee.lifecycle_lock():
+            self._restoredb(args)
+
+    def _restoredb(self, args):
         if not self.m2ee.config.allow_destroy_db():
             logger.error("Refusing to do a destructive database operation "
                          "because the allow_destroy_db configuration option "
@@ -569,7 +749,7 @@ class CLI(cmd.Cmd, object):
         if answer != 'y':
             logger.info("Aborting!")
             return
-        pgutil.restoredb(self.m2ee.config, args)
+        m2ee.pgutil.restoredb(self.m2ee.config, args)
 
     def complete_restoredb(self, text, line, begidx, endidx):
         if not self.m2ee.config.is_using_postgresql():
@@ -581,6 +761,10 @@ class CLI(cmd.Cmd, object):
                 f.endswith(".backup")]
 
     def do_emptydb(self, args):
+        with self.m2ee.lifecycle_lock():
+            self._emptydb(args)
+
+    def _emptydb(self, args):
         if not self.m2ee.config.allow_destroy_db():
             logger.error("Refusing to do a destructive database operation "
                          "because the allow_destroy_db configuration option "
@@ -602,9 +786,13 @@ class CLI(cmd.Cmd, object):
         if answer != 'y':
             print("Aborting!")
             return
-        pgutil.emptydb(self.m2ee.config)
+        m2ee.pgutil.emptydb(self.m2ee.config)
 
     def do_unpack(self, args):
+        with self.m2ee.lifecycle_lock():
+            self._unpack(args)
+
+    def _unpack(self, args):
         if not args:
             logger.error("unpack needs the name of a model upload zipfile in "
                          "%s as argument" %
@@ -710,17 +898,34 @@ class CLI(cmd.Cmd, object):
             raise e
 
     def do_show_current_runtime_requests(self, args):
-        feedback = self.m2ee.client.get_current_runtime_requests()
-        if len(feedback) == 0:
+        feedback = self.m2ee.client.get_current_runtime_requests(stream=True)
+        if self._print_streamed_feedback(feedback, "Current running Runtime Requests:") == 0:
             logger.info("There are no currently running runtime requests.")
-        else:
-            print("Current running Runtime Requests:")
-            print(yaml.safe_dump(feedback, default_flow_style=False))
 
     def do_show_all_thread_stack_traces(self, args):
-        feedback = self.m2ee.client.get_all_thread_stack_traces()
-        print("Current JVM Thread Stacktraces:")
-        print(yaml.safe_dump(feedback, default_flow_style=False))
+        feedback = self.m2ee.client.get_all_thread_stack_traces(stream=True)
+        self._print_streamed_feedback(feedback, "Current JVM Thread Stacktraces:")
+
+    def _print_streamed_feedback(self, feedback, header):
+        """
+        Print feedback that is retrieved using stream=True as yaml, one item
+        at a time, and return the amount of items printed.
+        """
+        import yaml
+        count = 0
+        with feedback:
+            for item in feedback:
+                if count == 0:
+                    print(header)
+                if isinstance(item, tuple):
+                    item = dict([item])
+                else:
+                    item = [item]
+                sys.stdout.write(yaml.safe_dump(item, default_flow_style=False))
+                count += 1
+        if count > 0:
+            print("")
+        return count
 
     def do_interrupt_request(self, args):
         if args == "":
@@ -821,6 +1026,7 @@ class CLI(cmd.Cmd, object):
         return line
 
     def cmdloop_handle_ctrl_c(self):
+        m2ee.util.setup_readline()
         quit = False
         while quit is not True:
             try:
@@ -850,6 +1056,28 @@ class CLI(cmd.Cmd, object):
     def unchecked_onecmd(self, line):
         super(CLI, self).onecmd(line)
 
+    def oneshot(self, line):
+        """
+        Execute a command given on the command line, or received by the
+        agent, and return the exit status.
+        """
+        try:
+            self.unchecked_onecmd(line)
+        except (m2ee.client.M2EEAdminException,
+                m2ee.client.M2EEAdminHTTPException,
+                m2ee.client.M2EERuntimeNotFullyRunning,
+                m2ee.client.M2EEAdminTimeout,
+                m2ee.exceptions.M2EEException) as e:
+            logger.error(e)
+            return 1
+        except m2ee.client.M2EEAdminNotAvailable:
+            pid_alive, m2ee_alive = self.m2ee.check_alive()
+            if not pid_alive and not m2ee_alive:
+                logger.info("The application process is not running.")
+                return 0
+            return 1
+        return 0
+
     # if the emptyline function is not defined, Cmd will automagically
     # repeat the previous command given, and that's not what we want
     def emptyline(self):
@@ -872,6 +1100,8 @@ Available commands:
  start - try starting the application using the unpacked deployment files
  stop - stop the application
  restart - restart the application
+ bluegreen_restart - start the application on the alternate ports, switch the
+     web server over to it, and then stop the old application process
  status - display Mendix Runtime status (is the application running?
  create_admin_user - create first user when starting with an empty database
  update_admin_user - reset the password of an application user
@@ -907,10 +1137,17 @@ Available commands:
  statistics - show all application statistics that can be used for monitoring
  show_all_thread_stack_traces - show all low-level JVM threads with stack trace
  check_health - manually execute health check
+ client_stats [histogram] - show latency of admin API requests done by this
+     m2ee process
+ startup_profile - show how long each phase of recent application starts took
+ agent - keep running to execute monitoring commands for m2ee --via-agent
+ supervise - keep the application running, restarting it when the JVM process
+     dies or stops responding
 
 Extra commands you probably don't need:
  debug - dive into a local python debug session inside this program
- dump_config - dump the yaml configuration information
+ dump_config [origin] - dump the yaml configuration information, with
+     origin: show which file(s) set every value
  nodetach - do not detach the application process after starting
  reload - reload configuration from yaml files (this is done automatically)
  munin_config - configure option for the built-in munin plugin
@@ -991,6 +1228,18 @@ def main():
         dest="yolo_mode",
         help="automatically answer all questions to run as non-interactively as possible"
     )
+    parser.add_argument(
+        "--via-agent",
+        action="store_true",
+        default=False,
+        dest="via_agent",
+        help="let a running m2ee agent execute the command, if there is one"
+    )
+    parser.add_argument(
+        "--agent-socket",
+        dest="agent_socket",
+        help="socket of the m2ee agent, when not in the default location"
+    )
     parser.add_argument(
         "onecmd",
         nargs='*',
@@ -1006,6 +1255,20 @@ def main():
         verbosity = 5
     start_console_logging(verbosity)
 
+    if args.via_agent and args.onecmd:
+        try:
+            answer = m2ee.agent.call(args.agent_socket or m2ee.agent.get_default_socket(),
+                                     ' '.join(args.onecmd), verbosity)
+        except m2ee.exceptions.M2EEException as e:
+            logger.warning("%s, executing the command ourselves." % e)
+            answer = None
+        if answer is not None:
+            status, stdout, stderr = answer
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            sys.exit(status)
+        logger.debug("Executing the command ourselves.")
+
     try:
         cli = CLI(
             yaml_files=args.yaml_files,
@@ -1017,21 +1280,7 @@ def main():
 
     atexit.register(cli._cleanup_logging)
     if args.onecmd:
-        try:
-            cli.unchecked_onecmd(' '.join(args.onecmd))
-        except (m2ee.client.M2EEAdminException,
-                m2ee.client.M2EEAdminHTTPException,
-                m2ee.client.M2EERuntimeNotFullyRunning,
-                m2ee.client.M2EEAdminTimeout,
-                m2ee.exceptions.M2EEException) as e:
-            logger.error(e)
-            sys.exit(1)
-        except m2ee.client.M2EEAdminNotAvailable:
-            pid_alive, m2ee_alive = cli.m2ee.check_alive()
-            if not pid_alive and not m2ee_alive:
-                logger.info("The application process is not running.")
-                sys.exit(0)
-            sys.exit(1)
+        sys.exit(cli.oneshot(' '.join(args.onecmd)))
     else:
         logger.info("Application Name: %s" % cli.m2ee.config.get_app_name())
         cli.onecmd('status')
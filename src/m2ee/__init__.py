@@ -22,10 +22,21 @@ def monkeypatch_logging():
 if not hasattr(logging, 'trace'):
     monkeypatch_logging()
 
-from m2ee.core import M2EE  # noqa
-import m2ee.pgutil  # noqa
-import m2ee.nagios  # noqa
-import m2ee.munin  # noqa
-import m2ee.version  # noqa
-
 __version__ = '8.0.1'
+
+# Submodules are only imported when used, so that short-lived invocations,
+# like munin plugins and nagios checks, don't pay for loading everything.
+_submodules = ('agent', 'aioclient', 'cds', 'cgroup', 'client', 'client_errno', 'clientbench',
+               'config', 'configbench', 'configcache', 'configlayers', 'core', 'exceptions',
+               'fakeserver', 'filewatch', 'jsonstream', 'munin', 'nagios', 'pgutil', 'runner',
+               'smaps', 'startupbench', 'startupprofile', 'supervisor', 'util', 'version', 'warmup')
+
+
+def __getattr__(name):
+    if name == 'M2EE':
+        from m2ee.core import M2EE
+        return M2EE
+    if name in _submodules:
+        import importlib
+        return importlib.import_module('m2ee.%s' % name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,291 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+A long running m2ee process that executes monitoring commands on behalf of
+short-lived m2ee invocations, like munin plugins and nagios checks, so that
+those don't have to load the configuration and connect to the admin API every
+single time.
+
+The agent listens on a unix domain socket. A request is a single line of json
+with the command and the log level of the caller. The answer is a json object
+with the exit status and the output of the command, after which the agent
+closes the connection.
+"""
+
+import contextlib
+import fcntl
+import io
+import json
+import logging
+import os
+import pwd
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+
+from m2ee.exceptions import M2EEException
+
+logger = logging.getLogger(__name__)
+
+# Commands that only look at the application, and can be run by the agent.
+default_commands = [
+    'about',
+    'check_health',
+    'client_stats',
+    'munin_config',
+    'munin_values',
+    'nagios',
+    'show_cache_statistics',
+    'show_critical_log_messages',
+    'show_current_runtime_requests',
+    'show_debugger_status',
+    'show_license_information',
+    'startup_profile',
+    'statistics',
+    'status',
+    'who',
+]
+
+# Commands that show statistics, of which the output is never reused, since
+# it should be up to date every time it's asked for.
+_uncached_commands = ('client_stats', 'show_cache_statistics', 'statistics')
+
+# How long a client waits for the answer of the agent.
+CLIENT_TIMEOUT = 60
+
+_MAX_REQUEST_SIZE = 65536
+
+
+def get_default_socket():
+    """
+    The location of the agent socket when it's not configured, which must be
+    known without loading the configuration.
+    """
+    return os.path.join(pwd.getpwuid(os.getuid())[5], ".m2ee", "agent.sock")
+
+
+def call(socket_path, line, level, timeout=CLIENT_TIMEOUT):
+    """
+    Let the agent listening on socket_path execute a command. Returns a tuple
+    of (exit status, stdout, stderr), or None when there's no agent, or when
+    it does not run this command. Raises M2EEException when the agent does
+    not answer properly.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except OSError as e:
+            logger.debug("Unable to connect to agent at %s: %s" % (socket_path, e))
+            return None
+        try:
+            request = json.dumps({'command': line, 'level': level})
+            sock.sendall(request.encode('utf-8') + b'\n')
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            answer = json.loads(b''.join(chunks).decode('utf-8'))
+            if answer.get('refused', False):
+                logger.warning("The agent at %s refused to run %s." % (socket_path, line))
+                return None
+            return (answer['exit'], answer['stdout'], answer['stderr'])
+        except (OSError, ValueError, KeyError, AttributeError) as e:
+            raise M2EEException("No valid answer from agent at %s: %s" % (socket_path, e))
+    finally:
+        sock.close()
+
+
+class Agent:
+    """
+    Runs the allowed commands for connecting clients in the given CLI
+    instance, one at a time.
+
+    Because the process keeps running, the configuration (that is only loaded
+    again when a file changed), admin API connections and cached admin API
+    feedback are reused by all requests. The complete output of commands is
+    also cached for output_cache_ttl seconds, as long as the process id of
+    the application process does not change.
+    """
+
+    def __init__(self, cli, options):
+        self._cli = cli
+        self._socket_path = options['socket']
+        self._commands = options.get('commands', default_commands)
+        self._keep_alive = options.get('admin_keep_alive', True)
+        self._cache_ttl = options.get('admin_cache_ttl', 60)
+        self._output_cache_ttl = options.get('output_cache_ttl', 10)
+        self._output_cache = {}
+        self._stopping = False
+
+    def run(self):
+        """
+        Serve requests until SIGTERM or SIGINT is received.
+        """
+        listener = self._listen()
+        wakeup_r, wakeup_w = os.pipe()
+        for fd in (wakeup_r, wakeup_w):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        previous_wakeup_fd = signal.set_wakeup_fd(wakeup_w)
+        previous_handlers = dict(
+            (signum, signal.signal(signum, self._handle_signal))
+            for signum in (signal.SIGTERM, signal.SIGINT))
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        logger.info("Agent listening on %s" % self._socket_path)
+        try:
+            while not self._stopping:
+                for key, _ in selector.select():
+                    if key.fileobj is listener:
+                        self._accept(listener)
+                    else:
+                        with contextlib.suppress(OSError):
+                            os.read(wakeup_r, 4096)
+        finally:
+            selector.close()
+            signal.set_wakeup_fd(previous_wakeup_fd)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+            listener.close()
+            with contextlib.suppress(OSError):
+                os.unlink(self._socket_path)
+        logger.info("Agent stopped.")
+
+    def _handle_signal(self, signum, frame):
+        logger.info("Received signal %s, stopping the agent." % signum)
+        self._stopping = True
+
+    def _listen(self):
+        if os.path.exists(self._socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self._socket_path)
+            except OSError:
+                logger.debug("Removing stale agent socket %s" % self._socket_path)
+                os.unlink(self._socket_path)
+            else:
+                raise M2EEException("Another agent is already listening on %s" %
+                                    self._socket_path)
+            finally:
+                probe.close()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Commands show information about the application, so only we
+        # ourselves may connect. Peer credentials are checked as well.
+        umask = os.umask(0o177)
+        try:
+            listener.bind(self._socket_path)
+        finally:
+            os.umask(umask)
+        listener.listen(16)
+        return listener
+
+    def _accept(self, listener):
+        try:
+            conn, _ = listener.accept()
+        except OSError as e:
+            logger.warning("Unable to accept agent connection: %s" % e)
+            return
+        with conn:
+            conn.settimeout(5)
+            try:
+                pid, uid, gid = struct.unpack(
+                    '3i', conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                          struct.calcsize('3i')))
+                if uid != os.getuid():
+                    logger.warning("Refusing agent connection from pid %s, uid %s" %
+                                   (pid, uid))
+                    return
+                request = self._read_request(conn)
+                answer = self._execute(request['command'], request.get('level'))
+                conn.sendall(json.dumps(answer).encode('utf-8'))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Invalid agent request: %s" % e)
+
+    def _read_request(self, conn):
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > _MAX_REQUEST_SIZE:
+                raise ValueError("request too large")
+        return json.loads(data.decode('utf-8'))
+
+    def _execute(self, line, level):
+        command = self._cli.parseline(line)[0]
+        if command not in self._commands:
+            return {'exit': 1, 'stdout': '', 'refused': True,
+                    'stderr': "ERROR: Command %s cannot be run by the agent\n" % command}
+
+        m2ee = self._cli.m2ee
+        try:
+            m2ee.reload_config_if_changed()
+        except M2EEException as e:
+            return {'exit': 1, 'stdout': '', 'stderr': "CRITICAL: %s\n" % e}
+        m2ee.client.keep_alive = self._keep_alive
+        m2ee.client.cache_ttl = self._cache_ttl
+
+        # The application may have been restarted by another m2ee process
+        # since the previous request, so don't trust the pid we read before.
+        pid = m2ee.runner.reread_pid()
+        key = (line, level, pid)
+        cached = self._output_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            logger.trace("Using cached output of %s" % line)
+            return cached[1]
+
+        logger.debug("Agent executing %s" % line)
+        answer = self._capture(line, level)
+        if self._output_cache_ttl > 0 and command not in _uncached_commands:
+            now = time.monotonic()
+            self._output_cache = dict((k, v) for k, v in self._output_cache.items()
+                                      if v[0] > now)
+            self._output_cache[key] = (now + self._output_cache_ttl, answer)
+        return answer
+
+    def _capture(self, line, level):
+        """
+        Execute a command, and return its exit status and everything it
+        printed or logged to stdout and stderr.
+        """
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        root = logging.getLogger()
+        previous_level = root.level
+        streams = {}
+        for handler in root.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                if handler.stream is sys.stdout:
+                    streams[handler] = handler.setStream(stdout)
+                elif handler.stream is sys.stderr:
+                    streams[handler] = handler.setStream(stderr)
+        if level is not None:
+            root.setLevel(level)
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    status = self._cli.oneshot(line)
+                except SystemExit as e:
+                    status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception as e:
+                    logger.error("Executing %s failed: %s" % (line, e))
+                    logger.debug("Details:", exc_info=True)
+                    status = 1
+        finally:
+            root.setLevel(previous_level)
+            for handler, stream in streams.items():
+                handler.setStream(stream)
+        return {'exit': status, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
@@ -0,0 +1,244 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import asyncio
+from base64 import b64encode
+import json
+import logging
+from urllib.parse import urlsplit
+
+from m2ee.client import M2EEAdminException, M2EEAdminHTTPException, \
+    M2EEAdminNotAvailable, M2EEAdminTimeout, M2EERuntimeNotFullyRunning
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncM2EEClient:
+    """
+    asyncio flavour of M2EEClient, providing the same admin actions as
+    coroutines. It only uses the standard library to talk HTTP, so a single
+    event loop can poll the admin ports of many applications at the same
+    time, e.g. using asyncio.gather.
+    """
+
+    def __init__(self, url, password):
+        self.url = url
+        split_url = urlsplit(url)
+        self._host = split_url.hostname
+        self._port = split_url.port or 80
+        self._path = split_url.path or '/'
+        self._authentication = b64encode(bytearray(password, 'utf-8')).decode('ascii')
+
+    async def request(self, action, params=None, timeout=None):
+        body = {
+            'action': action,
+            'params': params if params is not None else {}
+        }
+        logger.trace("M2EE request body: {}".format(body))
+        try:
+            status, headers, response_body = await asyncio.wait_for(
+                self._post(json.dumps(body).encode('utf-8')), timeout)
+        except asyncio.TimeoutError:
+            message = "Admin API does not respond. " \
+                "Timeout reached after {} seconds.".format(timeout)
+            logger.trace(message)
+            raise M2EEAdminTimeout(message)
+        except (OSError, EOFError, ValueError) as e:
+            message = "Admin API connection failed: {}".format(e)
+            logger.trace(message)
+            raise M2EEAdminNotAvailable(message)
+
+        if status != 200:
+            raise M2EEAdminHTTPException(
+                "Non OK http status code {}. Headers: {} Body: {}".format(
+                    status, headers, response_body.decode('utf-8', 'replace')))
+
+        response_json = json.loads(response_body.decode('utf-8'))
+        logger.trace("M2EE response: {}".format(response_json))
+        result = response_json['result']
+        if result == M2EEAdminException.ERR_ACTION_NOT_FOUND and action != 'runtime_status':
+            status = (await self.runtime_status())['status']
+            if status != 'running':
+                raise M2EERuntimeNotFullyRunning(status, action)
+        if result != 0:
+            raise M2EEAdminException(action, response_json)
+        return response_json.get('feedback', {})
+
+    async def _post(self, body):
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        try:
+            writer.write(
+                ("POST {} HTTP/1.1\r\n"
+                 "Host: {}:{}\r\n"
+                 "Content-Type: application/json\r\n"
+                 "Content-Length: {}\r\n"
+                 "X-M2EE-Authentication: {}\r\n"
+                 "Connection: close\r\n"
+                 "\r\n").format(self._path, self._host, self._port, len(body),
+                                self._authentication).encode('ascii') + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise EOFError("Connection closed without a response")
+            parts = status_line.split()
+            if len(parts) < 2 or not parts[0].startswith(b'HTTP/') or not parts[1].isdigit():
+                raise M2EEAdminHTTPException(
+                    "Invalid http status line: {!r}".format(status_line))
+            status = int(parts[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int((await reader.readline()).split(b';')[0], 16)
+                    if size == 0:
+                        break
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readline()
+                response_body = b''.join(chunks)
+            elif 'content-length' in headers:
+                response_body = await reader.readexactly(int(headers['content-length']))
+            else:
+                response_body = await reader.read()
+            return status, headers, response_body
+        finally:
+            writer.close()
+
+    async def ping(self, timeout=5):
+        try:
+            await self.echo(timeout=timeout)
+            return True
+        except (M2EEAdminException, M2EEAdminHTTPException,
+                M2EEAdminNotAvailable, M2EEAdminTimeout):
+            return False
+
+    async def echo(self, params=None, timeout=5):
+        myparams = {"echo": "ping"}
+        if params is not None:
+            myparams.update(params)
+        return await self.request("echo", myparams, timeout)
+
+    async def require_action(self, action):
+        feedback = await self.get_admin_action_info()
+        if action not in feedback['action_info']:
+            raise M2EEAdminException(
+                action,
+                {"result": M2EEAdminException.ERR_ACTION_NOT_FOUND}
+            )
+
+    async def get_admin_action_info(self, timeout=None):
+        return await self.request("get_admin_action_info", timeout=timeout)
+
+    async def get_critical_log_messages(self, timeout=None):
+        echo_feedback = await self.echo()
+        if echo_feedback['echo'] != "pong":
+            return echo_feedback['errors']
+        return []
+
+    async def shutdown(self, timeout):
+        logger.trace("Sending shutdown request: timeout=%s" % timeout)
+        # See M2EEClient.shutdown, the runtime exits while executing this
+        # request, so any error is expected and ignored.
+        try:
+            await self.request("shutdown", timeout=timeout)
+        except Exception:
+            pass
+
+    async def close_stdio(self, timeout=None):
+        return await self.request("close_stdio", timeout=timeout)
+
+    async def runtime_status(self, timeout=None):
+        return await self.request("runtime_status", timeout=timeout)
+
+    async def runtime_statistics(self, timeout=None):
+        return await self.request("runtime_statistics", timeout=timeout)
+
+    async def server_statistics(self, timeout=None):
+        return await self.request("server_statistics", timeout=timeout)
+
+    async def create_log_subscriber(self, params, timeout=None):
+        return await self.request("create_log_subscriber", params, timeout=timeout)
+
+    async def start_logging(self, timeout=None):
+        return await self.request("start_logging", timeout=timeout)
+
+    async def update_configuration(self, params, timeout=None):
+        return await self.request("update_configuration", params, timeout=timeout)
+
+    async def update_appcontainer_configuration(self, params, timeout=None):
+        return await self.request("update_appcontainer_configuration", params,
+                                  timeout=timeout)
+
+    async def start(self, params=None, timeout=None):
+        return await self.request("start", params, timeout=timeout)
+
+    async def get_ddl_commands(self, params=None, timeout=None):
+        return await self.request("get_ddl_commands", params, timeout=timeout)
+
+    async def execute_ddl_commands(self, params=None, timeout=None):
+        return await self.request("execute_ddl_commands", params, timeout=timeout)
+
+    async def update_admin_user(self, params, timeout=None):
+        return await self.request("update_admin_user", params, timeout=timeout)
+
+    async def create_admin_user(self, params, timeout=None):
+        return await self.request("create_admin_user", params, timeout=timeout)
+
+    async def get_logged_in_user_names(self, params=None, timeout=None):
+        return await self.request("get_logged_in_user_names", params, timeout=timeout)
+
+    async def set_jetty_options(self, params=None, timeout=None):
+        return await self.request("set_jetty_options", params, timeout=timeout)
+
+    async def add_mime_type(self, params, timeout=None):
+        return await self.request("add_mime_type", params, timeout=timeout)
+
+    async def about(self, timeout=None):
+        return await self.request("about", timeout=timeout)
+
+    async def set_log_level(self, params, timeout=None):
+        return await self.request("set_log_level", params, timeout=timeout)
+
+    async def get_log_settings(self, params, timeout=None):
+        return await self.request("get_log_settings", params, timeout=timeout)
+
+    async def check_health(self, params=None, timeout=None):
+        return await self.request("check_health", params, timeout=timeout)
+
+    async def get_current_runtime_requests(self, timeout=None):
+        return await self.request("get_current_runtime_requests", timeout=timeout)
+
+    async def interrupt_request(self, params, timeout=None):
+        return await self.request("interrupt_request", params, timeout=timeout)
+
+    async def get_all_thread_stack_traces(self, timeout=None):
+        return await self.request("get_all_thread_stack_traces", timeout=timeout)
+
+    async def get_license_information(self, timeout=None):
+        return await self.request("get_license_information", timeout=timeout)
+
+    async def set_license(self, params, timeout=None):
+        return await self.request("set_license", params, timeout=timeout)
+
+    async def create_runtime(self, params, timeout=None):
+        return await self.request("createruntime", params, timeout=timeout)
+
+    async def enable_debugger(self, params, timeout=None):
+        return await self.request("enable_debugger", params, timeout=timeout)
+
+    async def disable_debugger(self, timeout=None):
+        return await self.request("disable_debugger", timeout=timeout)
+
+    async def get_debugger_status(self, timeout=None):
+        return await self.request("get_debugger_status", timeout=timeout)
+
+    async def cache_statistics(self, timeout=None):
+        return await self.request("cache_statistics", timeout=timeout)
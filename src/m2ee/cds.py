@@ -0,0 +1,88 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Management of Application Class Data Sharing (AppCDS) archives, which let the
+JVM map already parsed and verified classes from a file, instead of loading
+them from the runtime and model jars on every start.
+
+An archive is created by the JVM itself when it exits after a start using
+-XX:ArchiveClassesAtExit (JDK 13+), and used in subsequent starts with
+-XX:SharedArchiveFile. Archives are named after the runtime version and a
+fingerprint of everything that determines which classes are loaded, so a new
+model or runtime automatically results in a new archive.
+"""
+
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# When any of these is specified in javaopts already, we keep our hands off.
+explicit_options = (
+    '-XX:SharedArchiveFile',
+    '-XX:ArchiveClassesAtExit',
+    '-XX:+AutoCreateSharedArchive',
+    '-Xshare:off',
+)
+
+
+def fingerprint(values, paths):
+    """
+    Returns a hash of the given values and of the contents of the given
+    files.
+    """
+    h = hashlib.sha1()
+    for value in values:
+        h.update(str(value).encode('utf-8'))
+        h.update(b'\0')
+    for path in paths:
+        h.update(path.encode('utf-8'))
+        try:
+            with open(path, 'rb') as f:
+                h.update(hashlib.sha1(f.read()).digest())
+        except IOError:
+            h.update(b'missing')
+        h.update(b'\0')
+    return h.hexdigest()[:16]
+
+
+def jar_stats(directory):
+    """
+    Returns (name, size, mtime) for all jar files in directory, as cheap
+    stand-in for hashing their contents.
+    """
+    if not os.path.isdir(directory):
+        return []
+    stats = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.jar'):
+            st = os.stat(os.path.join(directory, name))
+            stats.append((name, st.st_size, int(st.st_mtime)))
+    return stats
+
+
+def archive_path(directory, runtime_version, inputs_fingerprint):
+    return os.path.join(directory, "%s-%s.jsa" % (runtime_version, inputs_fingerprint))
+
+
+def has_explicit_options(cmd):
+    return any(arg.startswith(option) for arg in cmd for option in explicit_options)
+
+
+def cleanup(directory, keep=None):
+    """
+    Remove all archives in directory, except keep.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.jsa') and path != keep:
+            logger.debug("Removing outdated class data sharing archive %s" % path)
+            try:
+                os.unlink(path)
+            except OSError as e:
+                logger.warning("Cannot remove class data sharing archive %s: %s" % (path, e))
@@ -0,0 +1,190 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Derive JVM memory and processor options from the cgroup v2 limits that apply
+to the current process, which are inherited by the JVM we start.
+"""
+
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+PROC_CGROUP = '/proc/self/cgroup'
+
+MiB = 1024 * 1024
+
+# Per option we derive, the javaopts prefixes that mean it was set explicitly.
+explicit_options = {
+    'heap': ('-Xmx', '-XX:MaxHeapSize=', '-XX:MaxRAM=', '-XX:MaxRAMPercentage='),
+    'metaspace': ('-XX:MaxMetaspaceSize=',),
+    'stack': ('-Xss', '-XX:ThreadStackSize='),
+    'processors': ('-XX:ActiveProcessorCount=',),
+}
+
+default_profile = {
+    'heap_percentage': 60,
+    'metaspace_percentage': 10,
+    'thread_stack_size': None,
+}
+
+
+def get_cgroup_path(proc_cgroup=PROC_CGROUP):
+    """
+    Returns the cgroup v2 path of the current process, e.g.
+    /system.slice/app.service, or None when not using cgroup v2.
+    """
+    try:
+        with open(proc_cgroup) as f:
+            for line in f:
+                hierarchy, controllers, path = line.rstrip('\n').split(':', 2)
+                if hierarchy == '0' and controllers == '':
+                    return path
+    except (IOError, ValueError) as e:
+        logger.debug("Unable to determine cgroup of the current process: %s" % e)
+    return None
+
+
+def _read(filename):
+    try:
+        with open(filename) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def _directories(root, path):
+    """
+    Yields the directory of the cgroup at path and of all of its ancestors,
+    since a limit on any of them also restricts us.
+    """
+    parts = [part for part in path.split('/') if part]
+    while True:
+        yield os.path.join(root, *parts)
+        if not parts:
+            break
+        parts.pop()
+
+
+def read_memory_limit(root, path):
+    """
+    Returns (limit in bytes, file it was read from) for the lowest memory.max
+    or memory.high value that applies, or (None, None) if there's no limit.
+    """
+    limit, source = None, None
+    for directory in _directories(root, path):
+        for name in ('memory.max', 'memory.high'):
+            value = _read(os.path.join(directory, name))
+            if value is None or value == 'max':
+                continue
+            try:
+                value = int(value)
+            except ValueError:
+                logger.warning("Unable to parse %s: %s" % (os.path.join(directory, name), value))
+                continue
+            if limit is None or value < limit:
+                limit, source = value, os.path.join(directory, name)
+    return limit, source
+
+
+def read_cpu_limit(root, path):
+    """
+    Returns (number of cpus, file it was read from) for the lowest cpu.max
+    quota that applies, or (None, None) if there's no limit.
+    """
+    limit, source = None, None
+    for directory in _directories(root, path):
+        value = _read(os.path.join(directory, 'cpu.max'))
+        if value is None:
+            continue
+        try:
+            quota, period = value.split()
+            if quota == 'max':
+                continue
+            cpus = int(quota) / int(period)
+        except (ValueError, ZeroDivisionError):
+            logger.warning("Unable to parse %s: %s" % (os.path.join(directory, 'cpu.max'), value))
+            continue
+        if limit is None or cpus < limit:
+            limit, source = cpus, os.path.join(directory, 'cpu.max')
+    return limit, source
+
+
+def _is_explicit(option, javaopts):
+    return any(opt.startswith(prefix) for opt in javaopts
+               for prefix in explicit_options[option])
+
+
+def jvm_options(profile, javaopts, root=CGROUP_ROOT, proc_cgroup=PROC_CGROUP):
+    """
+    Returns a list of JVM options that fit the cgroup limits, using the
+    percentages in profile. Options that are present in javaopts are left
+    out, so that explicit configuration always wins.
+    """
+    settings = dict(default_profile)
+    settings.update(profile)
+
+    path = get_cgroup_path(proc_cgroup)
+    if path is None:
+        logger.info("JVM sizing: no cgroup v2 hierarchy found, not deriving "
+                    "JVM options from cgroup limits.")
+        return []
+
+    options = []
+    memory, memory_source = read_memory_limit(root, path)
+    if memory is None:
+        logger.info("JVM sizing: no memory limit found for cgroup %s, not "
+                    "deriving memory options." % path)
+    else:
+        logger.info("JVM sizing: memory limit is %d MiB, from %s" %
+                    (memory // MiB, memory_source))
+        if _is_explicit('heap', javaopts):
+            logger.info("JVM sizing: maximum heap size is set in javaopts, "
+                        "not deriving -Xmx.")
+        else:
+            heap = memory * settings['heap_percentage'] // 100 // MiB
+            logger.info("JVM sizing: -Xmx%dm is %s%% of the memory limit." %
+                        (heap, settings['heap_percentage']))
+            options.append('-Xmx%dm' % heap)
+        if _is_explicit('metaspace', javaopts):
+            logger.info("JVM sizing: maximum metaspace size is set in javaopts, "
+                        "not deriving -XX:MaxMetaspaceSize.")
+        else:
+            metaspace = memory * settings['metaspace_percentage'] // 100 // MiB
+            logger.info("JVM sizing: -XX:MaxMetaspaceSize=%dm is %s%% of the "
+                        "memory limit." % (metaspace, settings['metaspace_percentage']))
+            options.append('-XX:MaxMetaspaceSize=%dm' % metaspace)
+        if _is_explicit('stack', javaopts):
+            logger.info("JVM sizing: thread stack size is set in javaopts, "
+                        "not deriving -Xss.")
+        elif settings['thread_stack_size'] is not None:
+            logger.info("JVM sizing: -Xss%s is the configured thread stack size." %
+                        settings['thread_stack_size'])
+            options.append('-Xss%s' % settings['thread_stack_size'])
+        elif memory < 2048 * MiB:
+            logger.info("JVM sizing: -Xss512k, because the memory limit is "
+                        "below 2048 MiB, and every thread reserves its stack "
+                        "outside of the heap.")
+            options.append('-Xss512k')
+        else:
+            logger.info("JVM sizing: keeping the default thread stack size, "
+                        "since the memory limit is 2048 MiB or more.")
+
+    cpus, cpu_source = read_cpu_limit(root, path)
+    if cpus is None:
+        logger.info("JVM sizing: no cpu limit found for cgroup %s, not "
+                    "deriving -XX:ActiveProcessorCount." % path)
+    elif _is_explicit('processors', javaopts):
+        logger.info("JVM sizing: cpu limit is %.2f, from %s, but the active "
+                    "processor count is set in javaopts." % (cpus, cpu_source))
+    else:
+        count = max(1, int(math.ceil(cpus)))
+        logger.info("JVM sizing: -XX:ActiveProcessorCount=%d, since the cpu "
+                    "limit is %.2f, from %s" % (count, cpus, cpu_source))
+        options.append('-XX:ActiveProcessorCount=%d' % count)
+
+    return options
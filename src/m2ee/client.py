@@ -3,21 +3,61 @@
 #
 
 from base64 import b64encode
+import bisect
+import contextlib
+import copy
+import http.client
+import json
 import logging
+import os
+import select
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from m2ee import jsonstream
 
 logger = logging.getLogger(__name__)
 
-try:
-    import requests
-except ImportError:
-    logger.critical("Failed to import requests. This module is needed by "
-                    "m2ee. Please provide it on the python library path.")
-    raise
+# The requests module is only imported when it's actually used, see
+# RequestsTransport, since importing it takes a significant part of the
+# startup time of short lived m2ee commands.
+requests = None
+
+
+def _import_requests():
+    global requests
+    if requests is None:
+        try:
+            import requests
+        except ImportError:
+            logger.critical("Failed to import requests. This module is needed by "
+                            "m2ee. Please provide it on the python library path.")
+            raise
+    return requests
 
 
 class M2EEClient:
 
-    def __init__(self, url, password):
+    # Feedback of these actions hardly ever changes while the JVM process is
+    # alive, so it can be cached for a while. See cache_ttl.
+    cacheable_actions = (
+        'about',
+        'get_admin_action_info',
+        'get_license_information',
+        'runtime_status',
+    )
+
+    # Executing these actions can change the feedback of cached actions.
+    invalidating_actions = (
+        'update_configuration',
+        'start',
+        'shutdown',
+        'set_license',
+    )
+
+    def __init__(self, url, password, keep_alive=False, cache_ttl=0, transport=None):
         self.url = url
         self.headers = {
             'X-M2EE-Authentication': b64encode(bytearray(password, 'utf-8')),
@@ -27,44 +67,159 @@ class M2EEClient:
         self.proxies = {
             'http': None,
         }
-
-    def request(self, action, params=None, timeout=None):
+        # When keep_alive is enabled, connections are kept around and reused
+        # for subsequent requests. Connections are tagged with the pid of the
+        # process that created them, so that after an os.fork, the child
+        # process never touches sockets that are shared with the parent, but
+        # sets up connections of its own.
+        self.keep_alive = keep_alive
+        # The admin API is plain HTTP on localhost, which the http.client
+        # module from the standard library can handle just fine. Only for
+        # other urls, or when explicitly asked for, requests is used.
+        if transport is None:
+            transport = 'http.client' if urlsplit(url).scheme == 'http' else 'requests'
+        if transport == 'http.client':
+            self._transport = HTTPClientTransport(self)
+        elif transport == 'requests':
+            self._transport = RequestsTransport(self)
+        else:
+            raise ValueError("Unknown admin API transport: {}".format(transport))
+        # When cache_ttl is set to a positive number of seconds, feedback of
+        # cacheable actions is remembered for that long. Cache entries are
+        # bound to the pid of the JVM process, so that they're never used
+        # for another JVM process than the one they were retrieved from.
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._get_pid = None
+        self.request_statistics = M2EEClientStatistics()
+        # Deadlines are per thread, since the client can be shared by
+        # several threads, e.g. in request_many or in the m2ee agent.
+        self._local = threading.local()
+
+    def set_pid_source(self, get_pid):
+        """
+        Register a function that returns the pid of the JVM process that is
+        behind the admin API, used to key cached feedback on.
+        """
+        self._get_pid = get_pid
+
+    def invalidate_cache(self):
+        with self._cache_lock:
+            if self._cache:
+                logger.trace("Invalidating cached admin API feedback")
+            self._cache = {}
+
+    def _cache_get(self, action):
+        pid = self._get_pid() if self._get_pid is not None else None
+        with self._cache_lock:
+            entry = self._cache.get(action)
+            if entry is None:
+                return None
+            cached_pid, expires, feedback = entry
+            if cached_pid != pid or expires < time.time():
+                del self._cache[action]
+                return None
+        logger.trace("Using cached feedback for {}".format(action))
+        return copy.deepcopy(feedback)
+
+    def _cache_put(self, action, feedback):
+        # A starting runtime can change its status any moment.
+        if action == 'runtime_status' and feedback.get('status') != 'running':
+            return
+        pid = self._get_pid() if self._get_pid is not None else None
+        with self._cache_lock:
+            self._cache[action] = (pid, time.time() + self.cache_ttl,
+                                   copy.deepcopy(feedback))
+
+    @contextlib.contextmanager
+    def deadline(self, timeout):
+        """
+        Let all admin requests that are done inside this context share a
+        single time budget of timeout seconds. Also, as soon as one of them
+        times out, all remaining requests fail immediately with
+        M2EEAdminTimeout, instead of waiting for their own timeout again.
+
+        Deadlines can be nested, the inner one never reaches beyond the outer
+        one.
+        """
+        previous = getattr(self._local, 'deadline', None)
+        self._local.deadline = M2EEDeadline(timeout, parent=previous)
+        try:
+            yield self._local.deadline
+        finally:
+            self._local.deadline = previous
+
+    def _request_with_deadline(self, deadline, action, params, stream):
+        # Runs in a worker thread of request_many, which does not see the
+        # deadline of the calling thread by itself.
+        self._local.deadline = deadline
+        try:
+            return self.request(action, params, stream=stream)
+        finally:
+            self._local.deadline = None
+
+    def close(self):
+        self._transport.close()
+
+    def request(self, action, params=None, timeout=None, stream=False):
+        """
+        Execute an admin action and return its feedback. With stream set to
+        True, an iterator is returned instead, which decodes the feedback
+        while reading the response, and yields (name, value) tuples when the
+        feedback is an object or elements when it's a list. Errors reported
+        by the runtime are raised at the end of the iteration. An iterator
+        that is not consumed completely must be closed, using its close
+        method or as context manager, to release the connection.
+        """
         body = {
             'action': action,
             'params': params if params is not None else {}
         }
         logger.trace("M2EE request body: {}".format(body))
+        use_cache = (self.cache_ttl > 0 and params is None and not stream
+                     and action in M2EEClient.cacheable_actions)
+        if use_cache:
+            feedback = self._cache_get(action)
+            if feedback is not None:
+                return feedback
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is not None:
+            timeout = deadline.limit(action, timeout)
+        if action in M2EEClient.invalidating_actions:
+            self.invalidate_cache()
+
+        started = time.monotonic()
         try:
-            # We use a new connection for every request. We're in charge of
-            # starting and stopping and dealing with broken situations of the
-            # target of our calls, so let's reduce the amount of state that's
-            # dragged around.  Also, the runner code uses os.fork, and then
-            # accesses the Admin API using echo requests.
-            with requests.Session() as session:
-                response = session.post(
-                    self.url,
-                    headers=self.headers,
-                    json=body,
-                    timeout=timeout,
-                    proxies=self.proxies,
-                )
-        except requests.exceptions.Timeout:
-            message = "Admin API does not respond. " \
-                "Timeout reached after {} seconds.".format(timeout)
-            logger.trace(message)
-            raise M2EEAdminTimeout(message)
-        except requests.exceptions.ConnectionError as ce:
-            message = "Admin API connection failed: {}".format(ce)
-            logger.trace(message)
-            raise M2EEAdminNotAvailable(message)
-
-        if response.status_code != 200:
-            raise M2EEAdminHTTPException(
-                "Non OK http status code {}. Headers: {} Body: {}".format(
-                    response.status_code, response.headers, response.text))
+            response = self._transport.post(body, timeout, stream)
+            if not stream:
+                response_json = response.json()
+        except Exception as e:
+            self.request_statistics.record(action, time.monotonic() - started, e)
+            if isinstance(e, M2EEAdminTimeout) and deadline is not None:
+                deadline.trip()
+            raise
+        # For streamed responses, this is the time until the response headers
+        # were received.
+        elapsed = time.monotonic() - started
+
+        if stream:
+            self.request_statistics.record(action, elapsed)
+            return StreamedFeedback(self._iter_feedback(action, response), response)
 
-        response_json = response.json()
         logger.trace("M2EE response: {}".format(response_json))
+        try:
+            self._check_result(action, response_json)
+        except Exception as e:
+            self.request_statistics.record(action, elapsed, e)
+            raise
+        self.request_statistics.record(action, elapsed)
+        feedback = response_json.get('feedback', {})
+        if use_cache:
+            self._cache_put(action, feedback)
+        return feedback
+
+    def _check_result(self, action, response_json):
         result = response_json['result']
         if result == M2EEAdminException.ERR_ACTION_NOT_FOUND and action != 'runtime_status':
             status = self.runtime_status()['status']
@@ -72,7 +227,73 @@ class M2EEClient:
                 raise M2EERuntimeNotFullyRunning(status, action)
         if result != 0:
             raise M2EEAdminException(action, response_json)
-        return response_json.get('feedback', {})
+
+    def _iter_feedback(self, action, response):
+        members = {}
+        try:
+            for kind, payload in jsonstream.iter_response(
+                    response.iter_content(chunk_size=65536)):
+                if kind == jsonstream.MEMBER:
+                    name, value = payload
+                    members[name] = value
+                elif members.get('result', 0) == 0:
+                    yield payload
+        except (ValueError, M2EEAdminNotAvailable, M2EEAdminTimeout) as e:
+            message = "Reading admin API response for {} failed: {}".format(action, e)
+            logger.trace(message)
+            raise M2EEAdminNotAvailable(message)
+        finally:
+            response.close()
+        logger.trace("M2EE streamed response members: {}".format(members))
+        self._check_result(action, members)
+
+    def request_many(self, actions, timeout=None, max_workers=4, stream=()):
+        """
+        Execute a list of (action, params) tuples concurrently, using at most
+        max_workers threads. All requests share a single deadline, which is
+        timeout seconds from now, see deadline().
+
+        Returns a list with, in the same order as the actions, either the
+        feedback of a request or the exception that was raised executing it.
+        Actions that are listed in stream are requested with stream=True, and
+        the caller is responsible for consuming the returned iterator.
+        """
+        if len(actions) == 0:
+            return []
+
+        from concurrent.futures import ThreadPoolExecutor, wait
+        with self.deadline(timeout) as deadline:
+            executor = ThreadPoolExecutor(max_workers=min(max_workers, len(actions)))
+            futures = []
+            try:
+                for action, params in actions:
+                    futures.append(executor.submit(self._request_with_deadline, deadline,
+                                                   action, params, action in stream))
+                wait(futures, timeout=deadline.remaining())
+            finally:
+                # Do not block on requests that are still running after the
+                # deadline has passed. They will end by their own socket
+                # timeout. Requests that did not start yet are cancelled,
+                # which shutdown(cancel_futures=True) only does on python 3.9
+                # and newer.
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+        results = []
+        for (action, _), future in zip(actions, futures):
+            if not future.done() or future.cancelled():
+                if action in stream:
+                    # Nobody will consume a response that arrives after all.
+                    future.add_done_callback(_close_streamed_result)
+                results.append(M2EEAdminTimeout(
+                    "Admin API does not respond. Timeout reached after {} seconds "
+                    "while executing {}.".format(_format_timeout(timeout), action)))
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
 
     def ping(self, timeout=5):
         try:
@@ -177,14 +398,14 @@ class M2EEClient:
     def check_health(self, params=None, timeout=None):
         return self.request("check_health", params, timeout=timeout)
 
-    def get_current_runtime_requests(self, timeout=None):
-        return self.request("get_current_runtime_requests", timeout=timeout)
+    def get_current_runtime_requests(self, timeout=None, stream=False):
+        return self.request("get_current_runtime_requests", timeout=timeout, stream=stream)
 
     def interrupt_request(self, params, timeout=None):
         return self.request("interrupt_request", params, timeout=timeout)
 
-    def get_all_thread_stack_traces(self, timeout=None):
-        return self.request("get_all_thread_stack_traces", timeout=timeout)
+    def get_all_thread_stack_traces(self, timeout=None, stream=False):
+        return self.request("get_all_thread_stack_traces", timeout=timeout, stream=stream)
 
     def get_license_information(self, timeout=None):
         return self.request("get_license_information", timeout=timeout)
@@ -208,6 +429,424 @@ class M2EEClient:
         return self.request("cache_statistics", timeout=timeout)
 
 
+class M2EEDeadline:
+    """
+    A time budget that is shared by a group of admin requests, which also acts
+    as circuit breaker: after the first request that timed out, it's tripped
+    and refuses to let any more requests through.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        self.timeout = timeout
+        self.expires = None if timeout is None else time.monotonic() + timeout
+        self.parent = parent
+        self.tripped = False
+
+    def remaining(self):
+        """
+        Returns the amount of seconds left, or None if there's no limit.
+        """
+        remaining = None
+        if self.expires is not None:
+            remaining = max(self.expires - time.monotonic(), 0)
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if remaining is None or (parent_remaining is not None
+                                     and parent_remaining < remaining):
+                remaining = parent_remaining
+        return remaining
+
+    def is_tripped(self):
+        return self.tripped or (self.parent is not None and self.parent.is_tripped())
+
+    def trip(self):
+        self.tripped = True
+        if self.parent is not None:
+            self.parent.trip()
+
+    def limit(self, action, timeout):
+        """
+        Returns the timeout to be used for a request, which is the given
+        timeout, capped by the time that is left. Raises M2EEAdminTimeout if
+        no request should be done at all any more.
+        """
+        if self.is_tripped():
+            raise M2EEAdminTimeout(
+                "Not executing {}, since an earlier admin API request timed out "
+                "already.".format(action))
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise M2EEAdminTimeout(
+                "Admin API does not respond. Timeout reached before sending "
+                "{}.".format(action))
+        if timeout is None or remaining < timeout:
+            return remaining
+        return timeout
+
+
+class M2EEClientStatistics:
+    """
+    Keeps track of the amount of admin requests done per action, with a
+    histogram of their latency, and counters for errors and timeouts.
+    """
+
+    # Upper bounds of the latency histogram buckets, in seconds. One more
+    # bucket at the end catches everything above the highest bound.
+    buckets = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+               1, 2, 5, 10, 20, 50)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._actions = {}
+        self._interval_start = {}
+
+    def record(self, action, duration, exception=None):
+        with self._lock:
+            stats = self._actions.get(action)
+            if stats is None:
+                stats = self._actions[action] = {
+                    'count': 0,
+                    'errors': 0,
+                    'timeouts': 0,
+                    'total': 0.0,
+                    'max': 0.0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            stats['count'] += 1
+            # A timeout only tells us that it took too long, so it's not
+            # added to the latency histogram.
+            if isinstance(exception, M2EEAdminTimeout):
+                stats['timeouts'] += 1
+                return
+            if exception is not None:
+                stats['errors'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['histogram'][bisect.bisect_left(self.buckets, duration)] += 1
+
+    def get(self):
+        with self._lock:
+            return copy.deepcopy(self._actions)
+
+    def mean(self, action):
+        with self._lock:
+            stats = self._actions.get(action)
+            if stats is None or stats['count'] == stats['timeouts']:
+                return None
+            return stats['total'] / (stats['count'] - stats['timeouts'])
+
+    def interval_mean(self, action):
+        """
+        Like mean, but only for the requests that were done since the
+        previous call to interval_mean for the action, e.g. since the previous
+        poll of a monitoring system. Returns None if there were none.
+        """
+        with self._lock:
+            stats = self._actions.get(action)
+            if stats is None:
+                return None
+            count = stats['count'] - stats['timeouts']
+            previous_count, previous_total = self._interval_start.get(action, (0, 0.0))
+            self._interval_start[action] = (count, stats['total'])
+            if count == previous_count:
+                return None
+            return (stats['total'] - previous_total) / (count - previous_count)
+
+    @classmethod
+    def percentile(cls, histogram, percentage):
+        """
+        Returns the upper bound of the bucket that contains the given
+        percentile, or None if it's in the last bucket, or there's no data.
+        """
+        total = sum(histogram)
+        if total == 0:
+            return None
+        seen = 0
+        for i, count in enumerate(histogram):
+            seen += count
+            if seen * 100 >= total * percentage:
+                return cls.buckets[i] if i < len(cls.buckets) else None
+
+
+class StreamedFeedback:
+    """
+    Iterator over the feedback of a streamed admin API response.
+    """
+
+    def __init__(self, items, response):
+        self._items = items
+        self._response = response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._items)
+
+    def close(self):
+        # Closing a generator that never started does not run its finally
+        # clause, so the response is closed here as well.
+        self._items.close()
+        self._response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _close_streamed_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _format_timeout(timeout):
+    # Timeouts that are limited by a deadline are arbitrary fractions.
+    return timeout if timeout is None else "{:g}".format(round(timeout, 1))
+
+
+@contextlib.contextmanager
+def _http_client_errors(timeout):
+    try:
+        yield
+    except socket.timeout:
+        message = "Admin API does not respond. " \
+            "Timeout reached after {} seconds.".format(_format_timeout(timeout))
+        logger.trace(message)
+        raise M2EEAdminTimeout(message)
+    except (OSError, http.client.HTTPException) as e:
+        message = "Admin API connection failed: {}".format(e)
+        logger.trace(message)
+        raise M2EEAdminNotAvailable(message)
+
+
+class HTTPClientTransport:
+    """
+    Sends admin requests using http.client from the standard library.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        split_url = urlsplit(client.url)
+        self._host = split_url.hostname
+        self._port = split_url.port or 80
+        self._path = split_url.path or '/'
+        # Idle keep-alive connections, which belong to the process with pid
+        # _idle_pid. There can be more than one, when using request_many.
+        self._idle = []
+        self._idle_pid = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self, timeout):
+        pid = os.getpid()
+        with self._lock:
+            if self._idle_pid != pid:
+                if self._idle:
+                    logger.trace("[%s] Discarding admin connections inherited from "
+                                 "pid %s" % (pid, self._idle_pid))
+                # Do not close them, the sockets still belong to the parent process.
+                self._idle = []
+                self._idle_pid = pid
+            while self._idle:
+                connection = self._idle.pop()
+                if self._is_dropped(connection):
+                    connection.close()
+                    continue
+                connection.timeout = timeout
+                connection.sock.settimeout(timeout)
+                return connection
+        return http.client.HTTPConnection(self._host, self._port, timeout=timeout)
+
+    def _is_dropped(self, connection):
+        # There's nothing to read on a healthy idle connection. If there is,
+        # the runtime closed it, e.g. because it was restarted in the meantime.
+        if connection.sock is None:
+            return True
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+        return len(readable) > 0
+
+    def release(self, connection, reusable):
+        if reusable and self._client.keep_alive:
+            with self._lock:
+                if self._idle_pid == os.getpid():
+                    self._idle.append(connection)
+                    return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            if self._idle_pid == os.getpid():
+                for connection in self._idle:
+                    connection.close()
+            self._idle = []
+            self._idle_pid = None
+
+    def post(self, body, timeout, stream):
+        headers = dict(self._client.headers)
+        headers['Content-Type'] = 'application/json'
+        connection = self._get_connection(timeout)
+        try:
+            with _http_client_errors(timeout):
+                connection.request('POST', self._path,
+                                   body=json.dumps(body).encode('utf-8'),
+                                   headers=headers)
+                response = connection.getresponse()
+                if response.status != 200:
+                    raise M2EEAdminHTTPException(
+                        "Non OK http status code {}. Headers: {} Body: {}".format(
+                            response.status, dict(response.getheaders()),
+                            response.read().decode('utf-8', 'replace')))
+        except Exception:
+            connection.close()
+            raise
+        return HTTPClientResponse(self, connection, response, timeout)
+
+
+class HTTPClientResponse:
+
+    def __init__(self, transport, connection, response, timeout):
+        self._transport = transport
+        self._connection = connection
+        self._response = response
+        self._timeout = timeout
+
+    def json(self):
+        try:
+            with _http_client_errors(self._timeout):
+                content = self._response.read()
+        finally:
+            self.close()
+        return json.loads(content.decode('utf-8'))
+
+    def iter_content(self, chunk_size):
+        with _http_client_errors(self._timeout):
+            while True:
+                chunk = self._response.read1(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def close(self):
+        if self._connection is None:
+            return
+        # Only a connection of which the response was read completely can be
+        # used for a next request.
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        self._transport.release(self._connection, reusable)
+        self._connection = None
+
+
+class RequestsTransport:
+    """
+    Sends admin requests using the requests library, which, other than
+    HTTPClientTransport, also supports e.g. https.
+    """
+
+    def __init__(self, client):
+        _import_requests()
+        self._client = client
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def _get_session(self):
+        pid = os.getpid()
+        with self._session_lock:
+            if self._session is not None and self._session_pid != pid:
+                logger.trace("[%s] Discarding admin connection pool inherited from "
+                             "pid %s" % (pid, self._session_pid))
+                # Do not close it, the sockets still belong to the parent process.
+                self._session = None
+            if self._session is None:
+                self._session = requests.Session()
+                self._session_pid = pid
+            return self._session
+
+    def close(self):
+        if self._session is not None and self._session_pid == os.getpid():
+            self._session.close()
+        self._session = None
+        self._session_pid = None
+
+    def post(self, body, timeout, stream):
+        if self._client.keep_alive:
+            session = self._get_session()
+        else:
+            # By default, we use a new connection for every request. We're
+            # in charge of starting and stopping and dealing with broken
+            # situations of the target of our calls, so let's reduce the
+            # amount of state that's dragged around.  Also, the runner code
+            # uses os.fork, and then accesses the Admin API using echo
+            # requests.
+            session = requests.Session()
+        try:
+            response = session.post(
+                self._client.url,
+                headers=self._client.headers,
+                json=body,
+                timeout=timeout,
+                proxies=self._client.proxies,
+                stream=stream,
+            )
+        except requests.exceptions.Timeout:
+            message = "Admin API does not respond. " \
+                "Timeout reached after {} seconds.".format(_format_timeout(timeout))
+            logger.trace(message)
+            self._close_session(session)
+            raise M2EEAdminTimeout(message)
+        except requests.exceptions.ConnectionError as ce:
+            message = "Admin API connection failed: {}".format(ce)
+            logger.trace(message)
+            self._close_session(session)
+            raise M2EEAdminNotAvailable(message)
+
+        if response.status_code != 200:
+            try:
+                raise M2EEAdminHTTPException(
+                    "Non OK http status code {}. Headers: {} Body: {}".format(
+                        response.status_code, response.headers, response.text))
+            finally:
+                response.close()
+                self._close_session(session)
+        return RequestsResponse(self, session, response)
+
+    def _close_session(self, session):
+        if not self._client.keep_alive:
+            session.close()
+
+
+class RequestsResponse:
+
+    def __init__(self, transport, session, response):
+        self._transport = transport
+        self._session = session
+        self._response = response
+
+    def json(self):
+        try:
+            return self._response.json()
+        except ValueError:
+            raise
+        except requests.exceptions.RequestException as e:
+            raise M2EEAdminNotAvailable("Admin API connection failed: {}".format(e))
+        finally:
+            self.close()
+
+    def iter_content(self, chunk_size):
+        try:
+            yield from self._response.iter_content(chunk_size=chunk_size)
+        except requests.exceptions.RequestException as e:
+            raise M2EEAdminNotAvailable("Admin API connection failed: {}".format(e))
+
+    def close(self):
+        self._response.close()
+        self._transport._close_session(self._session)
+
+
 class M2EEAdminHTTPException(Exception):
     pass
 
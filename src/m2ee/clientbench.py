@@ -0,0 +1,75 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Measure the latency of admin API requests done by M2EEClient, for both the
+http.client and the requests transport, with a new connection for every
+request, and with admin_keep_alive enabled. The time it takes to import
+either of them is shown by m2ee.startupbench.
+
+By default, requests go to an in-process FakeAdminServer, so that mostly the
+overhead of m2ee itself is measured:
+
+    python -m m2ee.clientbench --requests 500
+
+Or measure against the admin port of an application that is running:
+
+    python -m m2ee.clientbench --url http://127.0.0.1:9000/ --password secret
+"""
+
+import argparse
+import statistics
+import time
+
+from m2ee.client import M2EEClient
+from m2ee.fakeserver import FakeAdminServer
+
+transports = ('http.client', 'requests')
+
+
+def measure(url, password, requests, transport, keep_alive):
+    """
+    Returns the median time of an echo request, in milliseconds.
+    """
+    client = M2EEClient(url, password, keep_alive=keep_alive, transport=transport)
+    try:
+        # Do not count setting up the first connection.
+        client.echo()
+        times = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            client.echo()
+            times.append(time.perf_counter() - started)
+    finally:
+        client.close()
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure admin API request latency")
+    parser.add_argument("--url", help="admin API url, instead of a fake admin server")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--transport", action="append", choices=transports,
+                        help="only measure this transport")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = FakeAdminServer(args.password).start()
+        url = server.url
+    try:
+        for transport in args.transport or transports:
+            for keep_alive in (False, True):
+                print("%-12s keep_alive %-5s  %7.3f ms/request" %
+                      (transport, keep_alive,
+                       measure(url, args.password, args.requests, transport, keep_alive)))
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,35 +4,66 @@
 
 import json
 import logging
-import yaml
 import os
 import sys
 import pwd
 import copy
 
-from collections import defaultdict
 from m2ee.version import MXVersion
 from m2ee.exceptions import M2EEException
+from m2ee import cds, cgroup, configcache, util
+from m2ee.configlayers import ConfigLayers, iter_leaves
 
 logger = logging.getLogger(__name__)
 
 
 class M2EEConfig:
 
-    def __init__(self, yaml_files=None):
+    def __init__(self, yaml_files=None, slot=None, use_cache=True):
         if yaml_files is None:
             yaml_files = find_yaml_files()
 
-        self._conf, self._mtimes = read_yaml_files(yaml_files)
+        cache_file = configcache.get_cache_file(yaml_files, slot) if use_cache else None
+        if cache_file is not None:
+            state = configcache.load(cache_file)
+            if state is not None:
+                self.__dict__.update(state)
+                # These checks also look at things that are not inputs of
+                # the cache, like directories that must exist, so that their
+                # warnings are shown every time, until they're fixed.
+                self._check_appcontainer_config()
+                self._check_runtime_config()
+                return
+
+        input_stats = {}
+        self._load(yaml_files, slot, input_stats)
+
+        # Only cache a configuration that has a model, so that the warning
+        # about it missing is shown every time, until it's fixed.
+        if cache_file is not None and self._all_systems_are_go:
+            configcache.save(cache_file, self.__dict__, input_stats)
+
+    def _load(self, yaml_files, slot, input_stats):
+        """
+        Reads and checks the configuration. All files and directories that
+        influence the result are added to input_stats, which are stat'ed
+        before reading them, so that a change while loading makes the cached
+        configuration outdated, instead of going unnoticed.
+        """
+        self._conf, self._mtimes, self._provenance = read_yaml_files(yaml_files, input_stats)
 
         self._all_systems_are_go = True
 
         self._check_appcontainer_config()
+        for path in self._get_cache_inputs():
+            input_stats[path] = configcache.stat_input(path)
         self._check_runtime_config()
+        self.slot = self._setup_blue_green_slot(slot)
         self._conf['mxruntime'].setdefault(
             'BasePath', self._conf['m2ee']['app_base'])
 
         self._conf['mxruntime']['DTAPMode'] = 'P'
+        self._provenance.pop(('mxruntime', 'DTAPMode'), None)
 
         self._model_metadata = self._try_load_json(
             os.path.join(
@@ -47,27 +78,78 @@ class M2EEConfig:
                         "because product version is yet unknown. "
                         "Try unpacking a deployment archive first.")
             self._all_systems_are_go = False
-            return
 
-        self.fix_permissions()
+        # Looking up the runtime, the classpath and fixing up permissions of
+        # the application directories is only done when actually needed, so
+        # that e.g. monitoring commands don't pay for it.
 
-        self._runtime_path = self.lookup_in_mxjar_repo(str(self.runtime_version))
-        if self._runtime_path is None:
+    @property
+    def _runtime_path(self):
+        if not hasattr(self, '_looked_up_runtime_path'):
+            self._looked_up_runtime_path = self._lookup_runtime_path()
+        return self._looked_up_runtime_path
+
+    def _lookup_runtime_path(self):
+        if self.runtime_version is None:
+            return None
+        runtime_path = self.lookup_in_mxjar_repo(str(self.runtime_version))
+        if runtime_path is None:
             logger.warning("Mendix Runtime not found for version %s. "
                            "You can try downloading it using the "
                            "download_runtime command." %
                            str(self.runtime_version))
-            self._all_systems_are_go = False
-            return
-
-        if self.runtime_version < 7:
-            self._setup_classpath()
+        return runtime_path
+
+    @property
+    def _classpath(self):
+        if not hasattr(self, '_set_up_classpath'):
+            if self.runtime_version is None or self.runtime_version >= 7 \
+                    or self._runtime_path is None:
+                self._set_up_classpath = None
+            else:
+                self._set_up_classpath = self._setup_classpath()
+        return self._set_up_classpath
 
-        if self._runtime_path and 'RuntimePath' not in self._conf['mxruntime']:
-            runtimePath = os.path.join(self._runtime_path, 'runtime')
-            logger.trace("Setting RuntimePath runtime config option to %s"
-                         % runtimePath)
-            self._conf['mxruntime']['RuntimePath'] = runtimePath
+    def _get_cache_inputs(self):
+        """
+        Returns the files and directories, other than the yaml files, that
+        influence the result of loading the configuration.
+        """
+        app_base = self._conf['m2ee']['app_base']
+        inputs = [os.path.join(app_base, 'model', 'metadata.json')]
+        # The magic runtimes directory is added to mxjar_repo when present.
+        inputs.append(os.path.join(app_base, 'runtimes'))
+        if self.get_blue_green_options():
+            inputs.append(self.get_active_slot_file())
+        return inputs
+
+    def _setup_blue_green_slot(self, slot):
+        """
+        When using blue/green restarts, the application runs either on the
+        ports from the m2ee section (blue), or on the alternate ports from the
+        blue_green section (green). Unless a slot is specified, the settings
+        for the slot that is active now are used.
+        """
+        options = self.get_blue_green_options()
+        if not options:
+            return None
+        for option in ('admin_port', 'runtime_port', 'upstream_file'):
+            if not options.get(option, None):
+                logger.critical("Option %s in the blue_green configuration section is "
+                                "not defined, ignoring blue/green configuration." % option)
+                return None
+        if slot is None:
+            slot = self.read_active_slot()
+        if slot == 'green':
+            self._conf['m2ee']['admin_port'] = options['admin_port']
+            self._conf['m2ee']['runtime_port'] = options['runtime_port']
+            self._conf['m2ee']['pidfile'] = options.get(
+                'pidfile', os.path.join(self.get_default_dotm2ee_directory(),
+                                        'm2ee-green.pid'))
+            for option in ('admin_port', 'runtime_port', 'pidfile'):
+                self._provenance[('m2ee', option)] = ['blue_green (green slot)']
+        logger.trace("Using blue/green slot %s" % slot)
+        return slot
 
     def _setup_classpath(self):
         logger.debug("Determining classpath to be used...")
@@ -81,11 +163,12 @@ class M2EEConfig:
                 logger.warning("extend_classpath option in m2ee section in "
                                "configuration is not a list")
 
-        self._classpath = ":".join(classpath)
-        if self._classpath:
-            logger.trace("Using classpath: %s" % self._classpath)
+        classpath = ":".join(classpath)
+        if classpath:
+            logger.trace("Using classpath: %s" % classpath)
         else:
             logger.debug("No classpath will be used")
+        return classpath
 
     def _try_load_json(self, jsonfile):
         logger.debug("Loading json configuration from %s" % jsonfile)
@@ -109,8 +192,26 @@ class M2EEConfig:
                 return True
         return False
 
-    def dump(self):
-        print(yaml.dump(self._conf, default_flow_style=False))
+    def get_watched_files(self):
+        """
+        Returns the files that, when changed, require loading the
+        configuration again.
+        """
+        files = list(self._mtimes)
+        files.append(os.path.join(self._conf['m2ee']['app_base'], 'model', 'metadata.json'))
+        if self.slot is not None:
+            files.append(self.get_active_slot_file())
+        return files
+
+    def dump(self, origin=False):
+        if not origin:
+            import yaml
+            print(yaml.dump(self._conf, default_flow_style=False))
+            return
+        for path, value in iter_leaves(self._conf):
+            files = self._provenance.get(path, ['set by m2ee'])
+            print("%s: %s  # %s" % ('.'.join(str(key) for key in path),
+                                    json.dumps(value, default=str), ', '.join(files)))
 
     def _check_appcontainer_config(self):
         # did we load any configuration at all?
@@ -307,7 +408,7 @@ class M2EEConfig:
         return self._conf['mimetypes']
 
     def all_systems_are_go(self):
-        return self._all_systems_are_go
+        return self._all_systems_are_go and self._runtime_path is not None
 
     def get_java_env(self):
         env = {}
@@ -363,12 +464,18 @@ class M2EEConfig:
         """
         cmd = flatten(self._conf['m2ee'].get('javabin', 'java'))
 
+        javaopts = []
         if 'javaopts' in self._conf['m2ee']:
             if isinstance(self._conf['m2ee']['javaopts'], list):
-                cmd.extend(self._conf['m2ee']['javaopts'])
+                javaopts = self._conf['m2ee']['javaopts']
             else:
                 logger.warning("javaopts option in m2ee section in configuration "
                                "is not a list")
+        jvm_sizing = self.get_jvm_sizing_options()
+        if jvm_sizing.get('enabled', False):
+            cmd.extend(cgroup.jvm_options(jvm_sizing, javaopts))
+        cmd.extend(javaopts)
+        self._add_class_data_sharing_options(cmd)
         if self.runtime_version >= 7:
             cmd.extend([
                 '-jar',
@@ -387,12 +494,85 @@ class M2EEConfig:
 
         return cmd
 
+    def _add_class_data_sharing_options(self, cmd):
+        archive = self.get_class_data_archive()
+        if archive is None:
+            return
+        if cds.has_explicit_options(cmd):
+            logger.debug("Not managing class data sharing, since javaopts "
+                         "already contain class data sharing options.")
+            return
+        if os.path.isfile(archive):
+            logger.debug("Using class data sharing archive %s" % archive)
+            cmd.append('-XX:SharedArchiveFile=%s' % archive)
+        else:
+            logger.info("No class data sharing archive is available yet for this "
+                        "runtime version and model. It will be created when the "
+                        "application process stops.")
+            cmd.append('-XX:ArchiveClassesAtExit=%s' % archive)
+
+    def get_class_data_sharing(self):
+        return self._conf['m2ee'].get('class_data_sharing', False)
+
+    def get_class_data_sharing_path(self):
+        return self._conf['m2ee'].get('class_data_sharing_path',
+                                      os.path.join(
+                                          self.get_default_dotm2ee_directory(),
+                                          'cds'))
+
+    def get_class_data_archive(self):
+        """
+        Returns the location of the class data sharing archive for the
+        current runtime version and model, whether it exists or not, or None
+        when class data sharing is not enabled or possible.
+        """
+        if not self.get_class_data_sharing() or self._runtime_path is None:
+            return None
+        directory = self.get_class_data_sharing_path()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                logger.warning("Cannot create class data sharing directory %s: %s" %
+                               (directory, e))
+                return None
+        model_path = os.path.join(self._conf['m2ee']['app_base'], 'model')
+        inputs = cds.fingerprint(
+            [
+                self.runtime_version,
+                os.path.realpath(self._runtime_path),
+                os.stat(self._runtime_path).st_mtime,
+                flatten(self._conf['m2ee'].get('javabin', 'java')),
+                cds.jar_stats(os.path.join(model_path, 'lib', 'userlib')),
+            ],
+            [os.path.join(model_path, 'metadata.json')],
+        )
+        return cds.archive_path(directory, self.runtime_version, inputs)
+
+    def cleanup_class_data_archives(self):
+        """
+        Remove class data sharing archives that do not match the current
+        runtime version and model any more.
+        """
+        if not self.get_class_data_sharing():
+            return
+        cds.cleanup(self.get_class_data_sharing_path(), keep=self.get_class_data_archive())
+
     def get_admin_port(self):
         return self._conf['m2ee']['admin_port']
 
     def get_admin_pass(self):
         return self._conf['m2ee']['admin_pass']
 
+    def get_admin_keep_alive(self):
+        return self._conf['m2ee'].get('admin_keep_alive', False)
+
+    def get_admin_cache_ttl(self):
+        return self._conf['m2ee'].get('admin_cache_ttl', 0)
+
+    def get_admin_transport(self):
+        return self._conf['m2ee'].get('admin_transport', None)
+
     def get_runtime_port(self):
         return self._conf['m2ee']['runtime_port']
 
@@ -405,10 +585,36 @@ class M2EEConfig:
                                           self.get_default_dotm2ee_directory(),
                                           'm2ee.pid'))
 
+    def get_startup_profile_file(self):
+        return self._conf['m2ee'].get('startup_profile_file',
+                                      os.path.join(
+                                          self.get_default_dotm2ee_directory(),
+                                          'startup-profiles.json'))
+
+    def get_startup_profile_history(self):
+        return self._conf['m2ee'].get('startup_profile_history', 20)
+
     def get_logfile(self):
         return self._conf['m2ee'].get('logfile', None)
 
+    def get_start_output_tail(self):
+        return self._conf['m2ee'].get('start_output_tail', 65536)
+
+    def get_start_output_file(self):
+        return self._conf['m2ee'].get('start_output_file', None)
+
+    def get_start_output_file_max_bytes(self):
+        return self._conf['m2ee'].get('start_output_file_max_bytes', 10485760)
+
+    def get_start_output_file_count(self):
+        return self._conf['m2ee'].get('start_output_file_count', 5)
+
     def get_runtime_config(self):
+        if self._runtime_path and 'RuntimePath' not in self._conf['mxruntime']:
+            runtimePath = os.path.join(self._runtime_path, 'runtime')
+            logger.trace("Setting RuntimePath runtime config option to %s"
+                         % runtimePath)
+            self._conf['mxruntime']['RuntimePath'] = runtimePath
         return self._conf['mxruntime']
 
     def get_logging_config(self):
@@ -423,6 +629,54 @@ class M2EEConfig:
     def get_munin_options(self):
         return self._conf['m2ee'].get('munin', {})
 
+    def get_nagios_options(self):
+        return self._conf['m2ee'].get('nagios', {})
+
+    def get_jvm_sizing_options(self):
+        return self._conf['m2ee'].get('jvm_sizing', {})
+
+    def get_blue_green_options(self):
+        return self._conf['m2ee'].get('blue_green', {})
+
+    def get_active_slot_file(self):
+        return self.get_blue_green_options().get(
+            'active_slot_file',
+            os.path.join(self.get_default_dotm2ee_directory(), 'active-slot'))
+
+    def read_active_slot(self):
+        try:
+            with open(self.get_active_slot_file()) as f:
+                slot = f.read().strip()
+        except IOError:
+            return 'blue'
+        if slot not in ('blue', 'green'):
+            logger.warning("Unknown active slot %s in %s, using blue." %
+                           (slot, self.get_active_slot_file()))
+            return 'blue'
+        return slot
+
+    def write_active_slot(self, slot):
+        util.write_file_atomically(self.get_active_slot_file(), "%s\n" % slot)
+
+    def get_supervise_options(self):
+        options = dict(self._conf['m2ee'].get('supervise', {}))
+        options.setdefault('report_path',
+                           os.path.join(self.get_default_dotm2ee_directory(),
+                                        'crash-reports'))
+        return options
+
+    def get_agent_options(self):
+        options = dict(self._conf['m2ee'].get('agent', {}))
+        options.setdefault('socket', os.path.join(self.get_default_dotm2ee_directory(),
+                                                  'agent.sock'))
+        return options
+
+    def get_drain_timeout(self):
+        return self._conf['m2ee'].get('drain_timeout', 0)
+
+    def get_warm_up_options(self):
+        return self._conf['m2ee'].get('warm_up', {})
+
     def allow_destroy_db(self):
         return self._conf['m2ee'].get('allow_destroy_db', True)
 
@@ -645,59 +899,53 @@ def find_yaml_files():
     return yaml_files
 
 
-def read_yaml_files(yaml_files):
-    config = defaultdict(dict)
+def read_yaml_files(yaml_files, input_stats=None):
+    """
+    Returns the merged configuration from all yaml files and the files they
+    include, the mtime of every file that was read, and for every setting the
+    list of files that set it. When input_stats is given, every file is
+    stat'ed for the configuration cache right before reading it.
+    """
+    layers = ConfigLayers()
     yaml_mtimes = {}
 
     for yaml_file in yaml_files:
-        config, yaml_mtimes = load_yaml_file(yaml_file, config, yaml_mtimes)
+        load_yaml_file(yaml_file, layers, yaml_mtimes, input_stats)
 
-    if 'include' in config:
-        include = config['include']
-        if isinstance(include, list):
-            for include_file in include:
-                config, yaml_mtimes = load_yaml_file(include_file, config, yaml_mtimes)
-        else:
-            logger.error("include present in config, but not a list, ignoring!")
+    include = layers.get_list('include')
+    if isinstance(include, list):
+        for include_file in include:
+            load_yaml_file(include_file, layers, yaml_mtimes, input_stats)
+    else:
+        logger.error("include present in config, but not a list, ignoring!")
 
-    return (config, yaml_mtimes)
+    # All layers are merged only once, after it's known which files are
+    # included, instead of copying the configuration so far for every file.
+    config, provenance = layers.merge()
+    return (config, yaml_mtimes, provenance)
 
 
-def load_yaml_file(yaml_file, config, yaml_mtimes):
+def load_yaml_file(yaml_file, layers, yaml_mtimes, input_stats=None):
+    # Not imported at the top, since it's not needed when the configuration
+    # cache can be used.
+    import yaml
     logger.debug("Loading configuration from %s" % yaml_file)
+    if input_stats is not None:
+        input_stats[yaml_file] = configcache.stat_input(yaml_file)
     try:
         with open(yaml_file) as f:
             additional_config = yaml.safe_load(f)
-        config = merge_config(config, additional_config)
+        layers.add(yaml_file, additional_config)
         yaml_mtimes[yaml_file] = os.stat(yaml_file)[8]
     except Exception as e:
         logger.warning("Error reading configuration file %s: %s, ignoring..." % (yaml_file, e))
-    return (config, yaml_mtimes)
 
 
 def merge_config(initial_config, additional_config):
-    result = copy.deepcopy(initial_config)
-    if additional_config is None:
-        return result
-    additional_config = copy.deepcopy(additional_config)
-    if initial_config is None:
-        return additional_config
-
-    for section in set(list(initial_config.keys()) + list(additional_config.keys())):
-        if section in initial_config:
-            if section in additional_config:
-                if isinstance(additional_config[section], dict):
-                    result[section] = merge_config(initial_config[section],
-                                                   additional_config[section])
-                elif isinstance(additional_config[section], list):
-                    result[section] = (initial_config[section] +
-                                       additional_config[section])
-                else:
-                    result[section] = additional_config[section]
-        else:
-            result[section] = additional_config[section]
-
-    return result
+    layers = ConfigLayers()
+    layers.add(None, initial_config)
+    layers.add(None, additional_config)
+    return layers.merge()[0]
 
 
 def flatten(l):
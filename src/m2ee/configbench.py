@@ -0,0 +1,172 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Measure how long loading the m2ee configuration takes, both when everything
+is read and checked again, and when the configuration cache in the .m2ee
+directory can be used.
+
+    python -m m2ee.configbench -c /etc/m2ee/m2ee.yaml
+
+Only a configuration for which the model of the application is present gets
+cached, so the cached numbers are missing for an application that has not
+been unpacked yet.
+
+The time that merging all yaml files takes, after parsing them, is shown
+separately. To see how that grows with the number of included files, use
+--generate to measure a generated configuration with that many includes,
+each setting 40 constants, some javaopts, environment variables and
+mimetypes, instead of an existing configuration:
+
+    python -m m2ee.configbench --generate 50
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from m2ee import configcache
+from m2ee.config import M2EEConfig, find_yaml_files
+from m2ee.configlayers import ConfigLayers
+
+
+def measure(runs, func):
+    """
+    Returns the median wall time of calling func, in milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def load_config(yaml_files, runs):
+    """
+    Returns the median time it takes to load the configuration from yaml_files
+    without and with the cache, in milliseconds. The latter is None when the
+    configuration can not be cached.
+    """
+    uncached = measure(runs, lambda: M2EEConfig(yaml_files=yaml_files, use_cache=False))
+    # Fills the cache, if possible.
+    M2EEConfig(yaml_files=yaml_files)
+    cache_file = configcache.get_cache_file(yaml_files, None)
+    if cache_file is None or configcache.load(cache_file) is None:
+        return uncached, None
+    return uncached, measure(runs, lambda: M2EEConfig(yaml_files=yaml_files))
+
+
+def merge_layers(yaml_files, runs):
+    """
+    Returns the median time it takes to merge the contents of yaml_files and
+    the files they include, without parsing them, in milliseconds.
+    """
+    import yaml
+    parsed = []
+    for yaml_file in yaml_files:
+        with open(yaml_file) as f:
+            parsed.append((yaml_file, yaml.safe_load(f)))
+    layers = ConfigLayers()
+    for name, data in parsed:
+        layers.add(name, data)
+    for include_file in layers.get_list('include'):
+        with open(include_file) as f:
+            parsed.append((include_file, yaml.safe_load(f)))
+
+    def merge():
+        layers = ConfigLayers()
+        for name, data in parsed:
+            layers.add(name, data)
+        layers.merge()
+    return measure(runs, merge)
+
+
+def generate(directory, includes):
+    """
+    Write a configuration with the given number of included files, and an
+    application with an empty model, into directory. Returns the list of
+    yaml files to load.
+    """
+    import yaml
+    app_base = os.path.join(directory, 'app')
+    for subdir in ('model', 'web', 'data', os.path.join('data', 'model-upload'),
+                   os.path.join('data', 'database')):
+        os.makedirs(os.path.join(app_base, subdir))
+    with open(os.path.join(app_base, 'model', 'metadata.json'), 'w') as f:
+        json.dump({'RuntimeVersion': '9.24.0.0', 'Constants': []}, f)
+    include_files = [os.path.join(directory, 'include-%03d.yaml' % n)
+                     for n in range(includes)]
+    main_file = os.path.join(directory, 'm2ee.yaml')
+    with open(main_file, 'w') as f:
+        yaml.safe_dump({
+            'm2ee': {
+                'app_name': 'bench',
+                'app_base': app_base,
+                'admin_port': 9000,
+                'admin_pass': 'benchmark',
+                'runtime_port': 8000,
+                'javaopts': ['-Dfile.encoding=UTF-8'],
+            },
+            'mxruntime': {'DatabasePassword': 'benchmark'},
+            'logging': [{'name': 'file', 'type': 'file', 'autosubscribe': 'INFO',
+                         'filename': os.path.join(directory, 'application.log')}],
+            'include': include_files,
+        }, f)
+    for n, include_file in enumerate(include_files):
+        with open(include_file, 'w') as f:
+            yaml.safe_dump({
+                'm2ee': {
+                    'javaopts': ['-Dinclude%d=true' % n],
+                    'custom_environment': {'INCLUDE_%d' % n: str(n)},
+                },
+                'mxruntime': {
+                    'MicroflowConstants': dict(
+                        ('Module%d.Constant%d' % (n, c), 'value %d' % c)
+                        for c in range(40)),
+                },
+                'mimetypes': {'ext%d' % n: 'application/x-include-%d' % n},
+            }, f)
+    return [main_file]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure loading the m2ee configuration")
+    parser.add_argument("-c", action="append", default=[], dest="yaml_files")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--generate", type=int, metavar="INCLUDES",
+                        help="measure a generated configuration with this many includes")
+    args = parser.parse_args()
+
+    # Warnings about the configuration would be repeated for every run.
+    logging.basicConfig(level=logging.ERROR)
+
+    directory = None
+    try:
+        if args.generate is not None:
+            directory = tempfile.mkdtemp(prefix='m2ee-configbench-')
+            yaml_files = generate(directory, args.generate)
+        else:
+            yaml_files = args.yaml_files or find_yaml_files()
+        merge = merge_layers(yaml_files, args.runs)
+        uncached, cached = load_config(yaml_files, args.runs)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+    print("merge only     %8.2f ms" % merge)
+    print("without cache  %8.2f ms" % uncached)
+    if cached is None:
+        print("with cache          n/a  (this configuration is not cached)")
+    else:
+        print("with cache     %8.2f ms" % cached)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Cache of the fully processed configuration, so that short-lived invocations
+like munin_values or nagios do not have to parse all yaml files again, as long
+as none of the files and directories that were used to compile it changed.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import pwd
+import stat
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Change when the layout of the cached data changes.
+CACHE_FORMAT = 4
+
+# Cache files of other configurations that were not written for this long are
+# removed, since they're likely left over from an earlier CACHE_FORMAT or a
+# list of yaml files that is not used any more.
+PRUNE_AGE = 30 * 24 * 3600
+
+
+def get_cache_file(yaml_files, slot):
+    """
+    Returns the location of the cache for this list of yaml files and
+    blue/green slot, or None if there's no .m2ee directory to put it in.
+    """
+    dotm2ee = os.path.join(pwd.getpwuid(os.getuid())[5], ".m2ee")
+    if not os.path.isdir(dotm2ee):
+        return None
+    # The same relative path, used in another directory, is another file.
+    yaml_files = [os.path.realpath(yaml_file) for yaml_file in yaml_files]
+    key = hashlib.sha1(repr((CACHE_FORMAT, yaml_files, slot)).encode('utf-8'))
+    return os.path.join(dotm2ee, "config-cache-%s.pickle" % key.hexdigest()[:16])
+
+
+def stat_input(path):
+    """
+    Returns what is remembered about an input, to find out later whether it
+    changed. Inputs must be stat'ed before reading them.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # Replacing a file by another one with the same size and mtime, e.g. by
+    # switching a symlink or renaming a copy, changes the inode.
+    return (st.st_mtime_ns, st.st_size, st.st_mode, st.st_ino, st.st_dev)
+
+
+def load(cache_file):
+    """
+    Returns the cached state, or None when there's no usable cache, or any of
+    the inputs changed.
+    """
+    cached = _read(cache_file)
+    if cached is None:
+        return None
+    # Relative paths, like those of includes, point to other files when
+    # we're started in another directory.
+    if cached['cwd'] is not None and cached['cwd'] != os.getcwd():
+        logger.trace("Configuration cache is outdated, the current directory changed.")
+        return None
+    changed = _changed_input(cached)
+    if changed is not None:
+        logger.trace("Configuration cache is outdated, %s changed." % changed)
+        return None
+    logger.trace("Using configuration cache %s" % cache_file)
+    return cached['state']
+
+
+def _read(cache_file):
+    try:
+        fd = os.open(cache_file, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        return None
+    try:
+        st = os.fstat(fd)
+        # Unpickling data that someone else could have written would allow
+        # them to run code as us.
+        if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            logger.warning("Ignoring configuration cache %s, since it's not owned "
+                           "by us, or writable by others." % cache_file)
+            return None
+        with os.fdopen(fd, 'rb') as f:
+            fd = None
+            cached = pickle.load(f)
+        if cached['format'] != CACHE_FORMAT:
+            raise ValueError("format %s is not %s" % (cached['format'], CACHE_FORMAT))
+        return cached
+    except Exception as e:
+        logger.debug("Unable to read configuration cache %s: %s" % (cache_file, e))
+        return None
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def _changed_input(cached):
+    for path, key in cached['inputs']:
+        if stat_input(path) != key:
+            return path
+    return None
+
+
+def save(cache_file, state, input_stats):
+    """
+    Store state, together with input_stats, which maps all paths that were
+    used to compile it to the result of stat_input from before reading them.
+    Other cache files that are outdated are removed.
+    """
+    relative = any(not os.path.isabs(path) for path in input_stats)
+    cached = {
+        'format': CACHE_FORMAT,
+        'cwd': os.getcwd() if relative else None,
+        'inputs': [(os.path.abspath(path), key) for path, key in input_stats.items()],
+        'state': state,
+    }
+    tmpname = None
+    try:
+        # mkstemp creates the file with mode 0600, and the configuration
+        # contains passwords, so keep it that way.
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(cache_file),
+                                       prefix='.config-cache-')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(cached, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmpname, cache_file)
+        logger.trace("Saved configuration cache to %s" % cache_file)
+    except Exception as e:
+        logger.debug("Unable to write configuration cache %s: %s" % (cache_file, e))
+        if tmpname is not None and os.path.exists(tmpname):
+            os.unlink(tmpname)
+        return
+    _prune(cache_file)
+
+
+def _prune(cache_file):
+    """
+    Remove cache files, other than cache_file, for which any of the inputs
+    changed, or that have not been written for PRUNE_AGE seconds.
+    """
+    dotm2ee = os.path.dirname(cache_file)
+    try:
+        names = os.listdir(dotm2ee)
+    except OSError:
+        return
+    now = time.time()
+    for name in names:
+        path = os.path.join(dotm2ee, name)
+        if not name.startswith('config-cache-') or not name.endswith('.pickle') \
+                or path == cache_file:
+            continue
+        try:
+            if now - os.lstat(path).st_mtime < PRUNE_AGE:
+                cached = _read(path)
+                if cached is not None and _changed_input(cached) is None:
+                    continue
+            os.unlink(path)
+            logger.trace("Removed outdated configuration cache %s" % path)
+        except Exception as e:
+            logger.debug("Unable to remove configuration cache %s: %s" % (path, e))
@@ -0,0 +1,105 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Configuration that is put together from a number of layers, e.g. one per yaml
+file, where every next layer is merged on top of the previous ones:
+mappings are merged, lists are concatenated, and other values replace
+earlier ones. For every value, it's remembered which layer(s) set it.
+"""
+
+from collections import defaultdict
+
+
+class ConfigLayers:
+
+    def __init__(self):
+        self._layers = []
+
+    def add(self, name, data):
+        """
+        Add the configuration data, which is a dict or None, as a new top
+        layer. Layers are not copied, so they should not be changed
+        afterwards.
+        """
+        if data is not None and not isinstance(data, dict):
+            raise TypeError("configuration must be a mapping, not %s" % type(data).__name__)
+        self._layers.append((name, data))
+
+    def get_list(self, key):
+        """
+        Returns the concatenation of all top level list values for key, as it
+        would be in the merged result, without merging everything.
+        """
+        result = []
+        for name, data in self._layers:
+            if data is not None and key in data:
+                if isinstance(data[key], list):
+                    result.extend(data[key])
+                else:
+                    result = data[key]
+        return result
+
+    def merge(self):
+        """
+        Returns (config, provenance). config is the merged configuration, as
+        defaultdict(dict), that shares no mutable data with the layers.
+        provenance maps the path of keys to each value to the list of names
+        of the layers that set it.
+
+        Every value in the layers is visited and copied once, so the cost is
+        linear in the total size of all layers.
+        """
+        config = defaultdict(dict)
+        provenance = {}
+        for name, data in self._layers:
+            if data is not None:
+                _merge_into(config, data, name, (), provenance)
+        return config, provenance
+
+
+def _merge_into(target, data, name, path, provenance):
+    for key, value in data.items():
+        keypath = path + (key,)
+        current = target.get(key, None)
+        if isinstance(value, dict) and isinstance(current, dict):
+            if not current:
+                provenance.pop(keypath, None)
+            _merge_into(current, value, name, keypath, provenance)
+        elif isinstance(value, list) and isinstance(current, list):
+            current.extend(_copy(value, name, keypath, {}))
+            provenance.setdefault(keypath, []).append(name)
+        else:
+            if isinstance(current, dict):
+                for stale in [p for p in provenance if p[:len(keypath)] == keypath]:
+                    del provenance[stale]
+            else:
+                provenance.pop(keypath, None)
+            target[key] = _copy(value, name, keypath, provenance)
+
+
+def _copy(value, name, path, provenance):
+    if isinstance(value, dict) and value:
+        result = {}
+        for key, item in value.items():
+            result[key] = _copy(item, name, path + (key,), provenance)
+        return result
+    provenance[path] = [name]
+    if isinstance(value, dict):
+        return {}
+    if isinstance(value, list):
+        return [_copy(item, name, path, {}) for item in value]
+    return value
+
+
+def iter_leaves(config, path=()):
+    """
+    Yields (path, value) for all values in config that are not mappings.
+    """
+    for key, value in config.items():
+        if isinstance(value, dict) and value:
+            for leaf in iter_leaves(value, path + (key,)):
+                yield leaf
+        else:
+            yield path + (key,), value
@@ -2,41 +2,111 @@
 # Copyright (C) 2009 Mendix. All rights reserved.
 #
 
+import contextlib
+import fcntl
 import logging
 import os
 import codecs
 import time
 import copy
+import subprocess
 
-from m2ee.config import M2EEConfig
-from m2ee.client import M2EEClient
+from m2ee.config import M2EEConfig, flatten
+from m2ee.client import M2EEClient, M2EEAdminException, M2EEAdminHTTPException, \
+        M2EEAdminNotAvailable, M2EEAdminTimeout, M2EERuntimeNotFullyRunning
 from m2ee.runner import M2EERunner
 from m2ee.version import MXVersion
 from m2ee.exceptions import M2EEException
 
-from m2ee import util
+from m2ee import util, startupprofile, warmup, filewatch
 
 logger = logging.getLogger(__name__)
 
 
 class M2EE():
 
-    def __init__(self, yaml_files=None):
+    def __init__(self, yaml_files=None, slot=None):
         self._yaml_files = yaml_files
+        self._slot = slot
+        self._config_watcher = None
+        self._lifecycle_lock_depth = 0
+        self.client = None
+        self.runner = None
         self.reload_config()
         self._logproc = None
+        self.startup_profile = None
 
     def reload_config_if_changed(self):
-        if self.config.mtime_changed():
+        if self._config_changed or self._config_watcher.changed():
             logger.info("Configuration change detected, reloading.")
             self.reload_config()
 
     def reload_config(self):
-        self.config = M2EEConfig(yaml_files=self._yaml_files)
+        self.config = M2EEConfig(yaml_files=self._yaml_files, slot=self._slot)
+        if self._config_watcher is not None:
+            self._config_watcher.close()
+        self._config_watcher = filewatch.watch(self.config.get_watched_files())
+        # Changes that happened while reading the configuration files are
+        # not seen by the watcher.
+        self._config_changed = self.config.mtime_changed()
+        # Long running processes, like the supervisor and the agent, reload
+        # the configuration every time it changes, so don't leave connections
+        # and the pidfd of the old ones behind.
+        previous_client = self.client
+        if self.runner is not None:
+            self.runner.close()
+        if previous_client is not None:
+            previous_client.close()
         self.client = M2EEClient(
             'http://127.0.0.1:%s/' % self.config.get_admin_port(),
-            self.config.get_admin_pass())
+            self.config.get_admin_pass(),
+            keep_alive=self.config.get_admin_keep_alive(),
+            cache_ttl=self.config.get_admin_cache_ttl(),
+            transport=self.config.get_admin_transport())
+        if previous_client is not None:
+            # Keep the statistics about admin requests so far, e.g. for
+            # client_stats and munin_values.
+            self.client.request_statistics = previous_client.request_statistics
         self.runner = M2EERunner(self.config, self.client)
+        self.client.set_pid_source(self.runner.get_pid)
+
+    @contextlib.contextmanager
+    def lifecycle_lock(self, wait=True):
+        """
+        Makes starting and stopping the application, and maintenance that
+        needs it to be stopped, like unpacking a model, mutually exclusive
+        between m2ee processes, e.g. an interactive restart and the
+        supervisor. Yields whether the lock was acquired, which is always the
+        case when waiting for it. Once acquired, the pidfile is read again,
+        since another process may have changed it in the meantime. Can be
+        nested.
+        """
+        if self._lifecycle_lock_depth > 0:
+            self._lifecycle_lock_depth += 1
+            try:
+                yield True
+            finally:
+                self._lifecycle_lock_depth -= 1
+            return
+        lockfile = "%s.lock" % self.config.get_pidfile()
+        try:
+            fd = os.open(lockfile, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as e:
+            raise M2EEException("Cannot open lock file %s: %s" % (lockfile, e))
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            self.runner.reread_pid()
+            self._lifecycle_lock_depth = 1
+            try:
+                yield True
+            finally:
+                self._lifecycle_lock_depth = 0
+        finally:
+            os.close(fd)
 
     def check_alive(self):
         pid_alive = self.runner.check_pid()
@@ -59,6 +129,7 @@ class M2EE():
         return (pid_alive, m2ee_alive)
 
     def start_appcontainer(self, detach=True, timeout=60):
+        self.startup_profile = startupprofile.StartupProfile()
         logger.debug("Checking if the runtime is already alive...")
         (pid_alive, m2ee_alive) = self.check_alive()
         if pid_alive is True or m2ee_alive is True:
@@ -71,6 +142,8 @@ class M2EE():
             raise M2EEException("Cannot start MxRuntime due to previous critical errors.",
                                 errno=M2EEException.ERR_MISSING_CONFIG)
 
+        self.config.fix_permissions()
+
         version = self.config.get_runtime_version()
 
         if version // 5 or version // 6:
@@ -79,13 +152,16 @@ class M2EE():
         if self.config.get_symlink_mxclientsystem():
             util.fix_mxclientsystem_symlink(self.config)
 
+        self.startup_profile.mark('prepare')
         logger.info("Trying to start the MxRuntime...")
-        self.runner.start(detach=detach, timeout=timeout)
+        self.runner.start(detach=detach, timeout=timeout, profile=self.startup_profile)
         logger.debug("MxRuntime status: %s" % self.client.runtime_status()['status'])
 
         # go do startup sequence
         self._configure_logging()
+        self.startup_profile.mark('logging')
         self._send_mime_types()
+        self.startup_profile.mark('mime_types')
 
         if version < 5:
             self._send_jetty_config()
@@ -96,17 +172,143 @@ class M2EE():
                 self.config.get_runtime_listen_addresses(),
                 "runtime_jetty_options": self.config.get_jetty_options()
             })
+        self.startup_profile.mark('jetty_options')
 
     def start_runtime(self, params=None, timeout=None):
         if params is None:
             params = {}
         logger.debug("MxRuntime status: %s" % self.client.runtime_status()['status'])
-        self.client.start(params, timeout)
+        try:
+            self.client.start(params, timeout)
+        except M2EEAdminException as e:
+            self._mark_startup_phase('start (result %s)' % e.result)
+            raise
+        self._mark_startup_phase('start')
         logger.debug("MxRuntime status: %s" % self.client.runtime_status()['status'])
         logger.info("The MxRuntime is fully started now.")
 
-    def stop(self, timeout=30):
+    def warm_up(self):
+        """
+        Send the warm-up requests from the configuration to the runtime port.
+        Returns a WarmUpResult, or None if no warm-up requests are configured.
+        """
+        options = self.config.get_warm_up_options()
+        if not options.get('requests'):
+            return None
+        result = warmup.warm_up(
+            warmup.runtime_host(self.config.get_runtime_listen_addresses()),
+            self.config.get_runtime_port(),
+            options['requests'],
+            concurrency=options.get('concurrency', 4),
+            duration=options.get('duration', 30),
+            timeout=options.get('timeout', 10))
+        self._mark_startup_phase('warm_up')
+        return result
+
+    def _mark_startup_phase(self, phase):
+        if self.startup_profile is not None:
+            self.startup_profile.mark(phase)
+
+    def save_startup_profile(self, result):
+        """
+        Finish the profile of the current start with result, e.g. 'started'
+        or 'aborted', and add it to the startup profile history.
+        """
+        if self.startup_profile is None:
+            return
+        self.startup_profile.finish(result)
+        startupprofile.write_profile(self.startup_profile,
+                                     self.config.get_startup_profile_file(),
+                                     self.config.get_startup_profile_history())
+        self.startup_profile = None
+
+    def get_startup_profiles(self):
+        return startupprofile.read_profiles(self.config.get_startup_profile_file())
+
+    def get_standby(self):
+        """
+        Returns an M2EE object for the blue/green slot that is not active.
+        """
+        slot = 'green' if self.config.slot == 'blue' else 'blue'
+        return M2EE(yaml_files=self._yaml_files, slot=slot)
+
+    def wait_until_healthy(self, timeout):
+        """
+        Wait until the health check of the application succeeds, for at most
+        timeout seconds. Applications without a health check microflow are
+        considered healthy as soon as they are running.
+        """
+        deadline = time.time() + timeout
+        interval = 0.1
+        while True:
+            try:
+                feedback = self.client.check_health(timeout=max(deadline - time.time(), 1))
+                if feedback['health'] in ('healthy', 'unknown'):
+                    return True
+                logger.debug("Health: %s %s" % (feedback['health'],
+                                                feedback.get('diagnosis', '')))
+            except M2EEAdminException as e:
+                if e.result == M2EEAdminException.ERR_ACTION_NOT_FOUND:
+                    return True
+                logger.debug("Health check failed: %s" % e)
+            except (M2EEAdminHTTPException, M2EEAdminNotAvailable, M2EEAdminTimeout,
+                    M2EERuntimeNotFullyRunning) as e:
+                logger.debug("Health check failed: %s" % e)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 2)
+
+    def activate(self):
+        """
+        Send web server traffic to this blue/green slot, by rewriting the
+        upstream include file and reloading the web server. Returns True if
+        the web server was reloaded successfully.
+        """
+        options = self.config.get_blue_green_options()
+        upstream_file = options['upstream_file']
+        template = options.get('upstream_template', "server 127.0.0.1:{runtime_port};\n")
+        try:
+            with open(upstream_file) as f:
+                previous = f.read()
+        except IOError:
+            previous = None
+        logger.info("Sending web server traffic to the %s slot on port %s..." %
+                    (self.config.slot, self.config.get_runtime_port()))
+        util.write_file_atomically(upstream_file, template.format(
+            runtime_port=self.config.get_runtime_port(),
+            admin_port=self.config.get_admin_port(),
+            slot=self.config.slot))
+        reload_command = options.get('reload_command', None)
+        if reload_command:
+            try:
+                retcode = subprocess.call(flatten(reload_command))
+            except OSError as e:
+                logger.error("Unable to run the web server reload command: %s, "
+                             "restoring the previous upstream file." % e)
+                retcode = None
+            if retcode != 0:
+                if retcode is not None:
+                    logger.error("The web server reload command returned a non-zero "
+                                 "exit code: %d, restoring the previous upstream file." %
+                                 retcode)
+                if previous is not None:
+                    util.write_file_atomically(upstream_file, previous)
+                return False
+        self.config.write_active_slot(self.config.slot)
+        return True
+
+    def stop(self, timeout=30, drain_timeout=None):
+        """
+        Shut down the application, after draining it for drain_timeout seconds,
+        which defaults to the configured drain_timeout.
+        """
         if self.client.ping():
+            if drain_timeout is None:
+                drain_timeout = self.config.get_drain_timeout()
+            if drain_timeout > 0:
+                self.drain(drain_timeout)
             logger.info("Waiting for the application to shutdown...")
             stopped = self.runner.stop(timeout)
             if stopped:
@@ -124,6 +326,65 @@ class M2EE():
                 self.runner.cleanup_pid()
                 return True
 
+    def drain(self, timeout):
+        """
+        Wait until there are no runtime requests running any more, for at most
+        timeout seconds, after which requests that are still running are
+        interrupted. Returns True if the runtime was idle in time.
+        """
+        deadline = time.time() + timeout
+        interval = 0.1
+        previous_count = None
+        while True:
+            try:
+                requests = self.client.get_current_runtime_requests(
+                    timeout=max(deadline - time.time(), 1))
+                stats = self.client.server_statistics(timeout=max(deadline - time.time(), 1))
+            except (M2EEAdminException, M2EEAdminHTTPException, M2EEAdminNotAvailable,
+                    M2EEAdminTimeout, M2EERuntimeNotFullyRunning) as e:
+                logger.warning("Unable to retrieve running requests, not waiting for "
+                               "them to finish: %s" % e)
+                return False
+            if len(requests) == 0:
+                if previous_count:
+                    logger.info("All running requests have finished.")
+                return True
+            if len(requests) != previous_count:
+                threadpool = stats.get('threadpool', None)
+                if threadpool is not None:
+                    logger.info("Waiting for %s running requests to finish (%s of %s "
+                                "web server threads busy)..." %
+                                (len(requests),
+                                 threadpool['threads'] - threadpool['idle_threads'],
+                                 threadpool['threads']))
+                else:
+                    logger.info("Waiting for %s running requests to finish..." %
+                                len(requests))
+                # Poll quickly again as long as requests are finishing, and back
+                # off when nothing happens.
+                if previous_count is not None and len(requests) < previous_count:
+                    interval = 0.1
+                previous_count = len(requests)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, 2)
+
+        logger.warning("There are still %s requests running after waiting %ss, "
+                       "interrupting them." % (len(requests), timeout))
+        for request in requests:
+            logger.warning("Interrupting %s %s of user %s, running for %sms" %
+                           (request.get('type'), request.get('name'),
+                            request.get('user'), request.get('duration')))
+            try:
+                self.client.interrupt_request({"request_id": request['request_id']})
+            except (M2EEAdminException, M2EEAdminHTTPException, M2EEAdminNotAvailable,
+                    M2EEAdminTimeout) as e:
+                logger.warning("Interrupting request %s failed: %s" %
+                               (request['request_id'], e))
+        return False
+
     def terminate(self, timeout=10):
         if self.runner.check_pid():
             logger.info("Waiting for the JVM process to disappear...")
@@ -203,6 +464,7 @@ class M2EE():
 
         logger.debug("Sending MxRuntime configuration...")
         self.client.update_configuration(config)
+        self._mark_startup_phase('update_configuration')
 
     def set_log_level(self, subscriber, node, level, timeout=None):
         params = {"subscriber": subscriber, "node": node, "level": level}
@@ -225,6 +487,8 @@ class M2EE():
     def unpack(self, mda_name):
         util.unpack(self.config, mda_name)
         self.reload_config()
+        self.config.fix_permissions()
+        self.config.cleanup_class_data_archives()
         post_unpack_hook = self.config.get_post_unpack_hook()
         if post_unpack_hook:
             util.run_post_unpack_hook(post_unpack_hook)
@@ -239,6 +503,7 @@ class M2EE():
                                 "user account.")
         util.download_and_unpack_runtime_curl(version, url, path, curl_opts)
         self.reload_config()
+        self.config.cleanup_class_data_archives()
 
     def list_installed_runtimes(self):
         runtimes_path = self.config.get_first_writable_mxjar_repo()
@@ -0,0 +1,520 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+A stand-in for the admin API of a Mendix Runtime, to be able to exercise and
+benchmark m2ee without a real JVM process.
+
+It can be used in-process:
+
+    with FakeAdminServer('secret') as server:
+        server.set_latency('runtime_statistics', 0.2)
+        client = M2EEClient(server.url, 'secret')
+
+Or started as separate process, e.g. on the admin_port of an existing m2ee
+configuration:
+
+    python -m m2ee.fakeserver --port 9000 --password secret --threads 15000
+"""
+
+import argparse
+from base64 import b64encode
+import copy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+
+from m2ee.client import M2EEAdminException
+
+logger = logging.getLogger(__name__)
+
+# Synthetic feedback for all admin actions, used unless a fixture is set for
+# an action. Feedback of actions that are not listed here, like
+# runtime_status and get_all_thread_stack_traces, is generated by the server.
+default_fixtures = {
+    "about": {
+        "name": "Mendix Runtime",
+        "version": "9.24.0.2965",
+        "model_version": "1.0.0.1",
+        "company": "Mendix Technology B.V.",
+        "copyright": "Copyright (c) 2005-2023 Mendix Technology B.V. "
+                     "All rights reserved.",
+        "java_version": "11.0.20",
+        "partner": "Mendix Technology B.V.",
+    },
+    "runtime_statistics": {
+        "languages": ["en_US"],
+        "entities": 42,
+        "sessions": {
+            "named_users": 25,
+            "anonymous_sessions": 2,
+            "named_user_sessions": 12,
+            "user_sessions": {},
+        },
+        "requests": {
+            "": 10,
+            "api/": 0,
+            "ws/": 3,
+            "xas/": 1024,
+            "ws-doc/": 0,
+            "file": 17,
+        },
+        "cache": {
+            "total_count": 0,
+            "disk_count": 0,
+            "memory_count": 0,
+        },
+        "connectionbus": {
+            "insert": 100,
+            "transaction": 900,
+            "update": 300,
+            "select": 4000,
+            "delete": 10,
+        },
+    },
+    "server_statistics": {
+        "threadpool": {
+            "threads_priority": 5,
+            "max_threads": 254,
+            "min_threads": 8,
+            "max_idle_time_s": 60,
+            "max_queued": -1,
+            "threads": 12,
+            "idle_threads": 6,
+            "max_stop_time_s": 30,
+        },
+        "memory": {
+            "init_heap": 268435456,
+            "code": 25165824,
+            "used_heap": 134217728,
+            "survivor": 4194304,
+            "max_nonheap": -1,
+            "committed_heap": 536870912,
+            "tenured": 100663296,
+            "permanent": 83886080,
+            "used_nonheap": 115343360,
+            "eden": 33554432,
+            "init_nonheap": 7667712,
+            "committed_nonheap": 125829120,
+            "max_heap": 1073741824,
+        },
+        "jetty": {
+            "max_idle_time_s": 200,
+            "current_connections": 3,
+            "max_connections": 0,
+            "max_idle_time_s_low_resources": 0,
+        },
+    },
+    "check_health": {
+        "health": "healthy",
+        "diagnosis": "",
+    },
+    "get_license_information": {
+        "license_id": "00000000-0000-0000-0000-000000000000",
+    },
+    "get_ddl_commands": {
+        "ddl_commands": [],
+    },
+    "get_logged_in_user_names": {
+        "count": 0,
+        "users": [],
+    },
+    "get_log_settings": {
+        "ConsoleLogSubscriber": {
+            "Core": "INFO",
+            "M2EE": "INFO",
+        },
+    },
+    "cache_statistics": {
+        "total_count": 0,
+        "disk_count": 0,
+        "memory_count": 0,
+    },
+    "get_debugger_status": {
+        "enabled": False,
+        "client_connected": False,
+        "number_of_paused_microflows": 0,
+    },
+    "interrupt_request": {
+        "result": False,
+    },
+}
+
+# Actions that are handled, but do not return any feedback by default.
+empty_actions = (
+    "close_stdio",
+    "create_admin_user",
+    "create_log_subscriber",
+    "createruntime",
+    "disable_debugger",
+    "enable_debugger",
+    "execute_ddl_commands",
+    "set_jetty_options",
+    "add_mime_type",
+    "set_license",
+    "set_log_level",
+    "start_logging",
+    "update_admin_user",
+    "update_appcontainer_configuration",
+    "update_configuration",
+)
+
+# Actions of which the feedback is generated by the server itself.
+generated_actions = (
+    "echo",
+    "get_admin_action_info",
+    "get_all_thread_stack_traces",
+    "get_current_runtime_requests",
+    "runtime_status",
+    "shutdown",
+    "start",
+)
+
+
+class FakeAdminServer:
+    """
+    Admin API server that answers requests with fixtures, with knobs to
+    inject latency, hanging requests, errors and huge responses.
+    """
+
+    def __init__(self, password, host='127.0.0.1', port=0, status='running'):
+        self._authentication = b64encode(bytearray(password, 'utf-8')).decode('ascii')
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._fixtures = copy.deepcopy(default_fixtures)
+        self._latency = {}
+        self._hang = set()
+        self._errors = {}
+        self._http_errors = {}
+        self._thread_count = 50
+        self._runtime_request_count = 0
+        self.status = status
+        self.request_counts = {}
+        self._httpd = ThreadingHTTPServer((host, port), _AdminRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%s/' % (host, port)
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        # Release hanging requests first, so that they can finish.
+        self._stopped.set()
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def load_fixtures(self, filename):
+        """
+        Read a json file with a mapping of action names to feedback, e.g.
+        recorded from a real runtime, and use it instead of the default
+        feedback.
+        """
+        with open(filename) as f:
+            fixtures = json.load(f)
+        for action, feedback in fixtures.items():
+            self.set_feedback(action, feedback)
+
+    def set_feedback(self, action, feedback):
+        with self._lock:
+            self._fixtures[action] = feedback
+
+    def set_latency(self, action, seconds):
+        """
+        Delay answering requests for action. With action set to None, all
+        requests are delayed.
+        """
+        with self._lock:
+            self._latency[action] = seconds
+
+    def set_hang(self, action, hang=True):
+        """
+        Never answer requests for action, until the server is stopped, to
+        make clients run into their timeout.
+        """
+        with self._lock:
+            if hang:
+                self._hang.add(action)
+            else:
+                self._hang.discard(action)
+
+    def set_error(self, action, result, message=None, cause=None, feedback=None):
+        """
+        Let action fail with the given result code, like e.g.
+        client_errno.start_INVALID_DB_STRUCTURE for start. A result of 0
+        removes the error again.
+        """
+        with self._lock:
+            if result == 0:
+                self._errors.pop(action, None)
+                return
+            self._errors[action] = {
+                "result": result,
+                "message": message if message is not None else "Fake error for %s" % action,
+                "cause": cause,
+                "feedback": feedback if feedback is not None else {},
+            }
+
+    def set_http_error(self, action, status):
+        with self._lock:
+            if status is None:
+                self._http_errors.pop(action, None)
+            else:
+                self._http_errors[action] = status
+
+    def set_thread_count(self, count):
+        """
+        Amount of threads that is reported by get_all_thread_stack_traces, to
+        produce responses of arbitrary size.
+        """
+        self._thread_count = count
+
+    def set_runtime_request_count(self, count):
+        """
+        Amount of requests that is reported by get_current_runtime_requests.
+        """
+        self._runtime_request_count = count
+
+    def handle(self, action, params):
+        """
+        Returns the (http status, response object) to send for an action.
+        """
+        with self._lock:
+            self.request_counts[action] = self.request_counts.get(action, 0) + 1
+            latency = self._latency.get(action, self._latency.get(None, 0))
+            hang = action in self._hang
+            http_error = self._http_errors.get(action)
+            error = self._errors.get(action)
+
+        if hang:
+            self._stopped.wait()
+            return None
+        if latency > 0 and self._stopped.wait(latency):
+            return None
+        if http_error is not None:
+            return http_error, {"result": -1, "message": "HTTP error %s" % http_error}
+        if error is not None:
+            return 200, dict(error)
+
+        known = self._fixtures.keys() | set(empty_actions) | set(generated_actions)
+        if action not in known:
+            return 200, {
+                "result": M2EEAdminException.ERR_ACTION_NOT_FOUND,
+                "message": "Action %s not found" % action,
+            }
+        if action in self._fixtures:
+            feedback = self._fixtures[action]
+        elif action in empty_actions:
+            feedback = {}
+        else:
+            feedback = getattr(self, '_' + action)(params, known)
+        return 200, {"result": 0, "feedback": feedback}
+
+    def _echo(self, params, known):
+        return {"echo": "pong"}
+
+    def _get_admin_action_info(self, params, known):
+        return {"action_info": dict((action, {}) for action in sorted(known))}
+
+    def _runtime_status(self, params, known):
+        return {"status": self.status}
+
+    def _start(self, params, known):
+        self.status = 'running'
+        return {}
+
+    def _shutdown(self, params, known):
+        self.status = 'stopped'
+        return {}
+
+    def _get_all_thread_stack_traces(self, params, known):
+        return dict(
+            ("Thread %s [id=%s]" % (i, i), [
+                "java.lang.Object.wait(Native Method)",
+                "java.lang.Object.wait(Object.java:502)",
+                "org.eclipse.jetty.util.thread.QueuedThreadPool.idleJobPoll("
+                "QueuedThreadPool.java:%s)" % i,
+                "java.lang.Thread.run(Thread.java:748)",
+            ])
+            for i in range(self._thread_count)
+        )
+
+    def _get_current_runtime_requests(self, params, known):
+        return [
+            {
+                "request_id": "00000000-0000-0000-0000-%012d" % i,
+                "type": "Microflow",
+                "name": "MyFirstModule.SlowMicroflow",
+                "user": "user%s" % i,
+                "duration": 1000 * i,
+            }
+            for i in range(self._runtime_request_count)
+        ]
+
+
+class _AdminRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('X-M2EE-Authentication') != fake._authentication:
+            return self._respond(200, {
+                "result": M2EEAdminException.ERR_FORBIDDEN,
+                "message": "Authentication failed",
+            })
+        if not self.headers.get('Content-Type', '').startswith('application/json'):
+            return self._respond(200, {
+                "result": M2EEAdminException.ERR_CONTENT_TYPE,
+                "message": "Content type should be application/json",
+            })
+        try:
+            request = json.loads(body.decode('utf-8'))
+            action = request['action']
+            params = request.get('params', {})
+        except (ValueError, KeyError, TypeError) as e:
+            return self._respond(200, {
+                "result": M2EEAdminException.ERR_READ_REQUEST,
+                "message": "Unable to read request: %s" % e,
+            })
+        logger.trace("Fake admin request: %s %s" % (action, params))
+        response = fake.handle(action, params)
+        if response is None:
+            # The server is being stopped while the request was hanging.
+            self.close_connection = True
+            return
+        self._respond(*response)
+
+    def do_GET(self):
+        self._respond(200, {
+            "result": M2EEAdminException.ERR_HTTP_METHOD,
+            "message": "Only POST is supported",
+        })
+
+    def _respond(self, status, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+def _action_value(text):
+    action, _, value = text.partition('=')
+    return action, value
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a fake Mendix Runtime admin API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--password", required=True)
+    parser.add_argument(
+        "--status",
+        default="running",
+        help="initial runtime status, e.g. created to be able to run start",
+    )
+    parser.add_argument(
+        "--fixtures",
+        action="append",
+        default=[],
+        help="json file with feedback per action",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        type=_action_value,
+        metavar="ACTION=SECONDS",
+        help="delay answers for an action, use * for all actions",
+    )
+    parser.add_argument(
+        "--hang",
+        action="append",
+        default=[],
+        metavar="ACTION",
+        help="never answer requests for an action",
+    )
+    parser.add_argument(
+        "--error",
+        action="append",
+        default=[],
+        type=_action_value,
+        metavar="ACTION=RESULT",
+        help="let an action fail with the given result code",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=50,
+        help="amount of threads in get_all_thread_stack_traces",
+    )
+    parser.add_argument(
+        "--runtime-requests",
+        type=int,
+        default=0,
+        help="amount of requests in get_current_runtime_requests",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log every request",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    server = FakeAdminServer(args.password, host=args.host, port=args.port,
+                             status=args.status)
+    for filename in args.fixtures:
+        server.load_fixtures(filename)
+    for action, seconds in args.latency:
+        server.set_latency(None if action == '*' else action, float(seconds))
+    for action in args.hang:
+        server.set_hang(action)
+    for action, result in args.error:
+        server.set_error(action, int(result))
+    server.set_thread_count(args.threads)
+    server.set_runtime_request_count(args.runtime_requests)
+
+    logger.info("Fake admin API listening on %s" % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Find out whether any of a set of files changed, without looking at all of
+them every time. On Linux, inotify is used through ctypes, elsewhere we fall
+back to comparing the result of stat.
+"""
+
+import errno
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+# Watching the directories, instead of the files themselves, also catches
+# editors and deployment tools that replace a file by renaming a new one over
+# it.
+DIRECTORY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT = struct.Struct('iIII')
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+def watch(paths):
+    """
+    Returns a watcher for paths. Until it's asked for changes for the first
+    time, it only remembers the result of stat of the paths, so that
+    processes that never check, like one-shot commands, don't load ctypes
+    and set up inotify for nothing.
+    """
+    return DeferredWatcher(paths)
+
+
+def _watch(paths):
+    """
+    Returns a watcher for paths, using inotify when possible.
+    """
+    try:
+        return InotifyWatcher(paths)
+    except (ImportError, OSError, AttributeError) as e:
+        logger.trace("Not using inotify to watch for configuration changes: %s" % e)
+        return StatWatcher(paths)
+
+
+class DeferredWatcher:
+
+    def __init__(self, paths):
+        self._paths = paths
+        self._snapshot = StatWatcher(paths)
+        self._watcher = None
+        self._changed = False
+
+    def changed(self):
+        if self._watcher is None:
+            # Start watching before comparing with the snapshot, so that no
+            # change can slip through in between.
+            self._watcher = _watch(self._paths)
+            self._changed = self._snapshot.changed()
+        return self._changed or self._watcher.changed()
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.close()
+
+
+class StatWatcher:
+    """
+    Detects changes by comparing the result of stat of every path.
+    """
+
+    def __init__(self, paths):
+        self._stats = dict((path, self._stat(path)) for path in paths)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def changed(self):
+        return any(self._stat(path) != st for path, st in self._stats.items())
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Detects changes by watching the directories that contain the paths using
+    inotify. Checking for changes is a single non-blocking read. Paths in a
+    directory that does not exist (yet) are checked using stat instead.
+    """
+
+    def __init__(self, paths):
+        import ctypes
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._names = {}
+        unwatched = []
+        for path in paths:
+            candidates = set([os.path.abspath(path), os.path.realpath(path)])
+            for candidate in candidates:
+                directory, name = os.path.split(candidate)
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), DIRECTORY_MASK)
+                if wd < 0:
+                    logger.trace("Unable to watch %s: %s" %
+                                 (directory, os.strerror(ctypes.get_errno())))
+                    unwatched.append(candidate)
+                    continue
+                self._names.setdefault(wd, set()).add(os.fsencode(name))
+        self._stat_watcher = StatWatcher(unwatched)
+        self._changed = False
+
+    def changed(self):
+        if self._changed:
+            return True
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & (IN_Q_OVERFLOW | IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED) \
+                        or name in self._names.get(wd, ()):
+                    self._changed = True
+        if not self._changed and self._stat_watcher.changed():
+            self._changed = True
+        return self._changed
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
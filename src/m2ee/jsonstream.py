@@ -0,0 +1,118 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import codecs
+import json
+import re
+
+# Kinds of things produced by iter_response
+MEMBER = 'member'
+ITEM = 'item'
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+_number_chars = re.compile(r'[0-9.eE+-]*\Z')
+
+
+class _TextBuffer:
+    """
+    Holds the not yet parsed part of a JSON document that is read from an
+    iterable of byte strings, decoding UTF-8 on the fly.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        try:
+            text = self._utf8.decode(next(self._chunks))
+        except StopIteration:
+            text = self._utf8.decode(b'', final=True)
+            self.eof = True
+        self.text = self.text[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _whitespace.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError("Expected one of %s at position %s, found %r" %
+                             (chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+                # A number at the end of the buffer might continue in the
+                # next chunk, also when it was cut right after e.g. the . of
+                # 1.5, so only accept it when something else follows.
+                if self.eof or not isinstance(value, (int, float)) \
+                        or isinstance(value, bool) \
+                        or not _number_chars.match(self.text, end):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_response(chunks):
+    """
+    Incrementally parse a JSON object, read from an iterable of bytes. For
+    each top level member, except feedback, a (MEMBER, (name, value)) tuple
+    is yielded. The contents of the feedback member is not decoded at once,
+    but yielded one element at a time as (ITEM, item) tuple instead. When
+    feedback is an object, item is a (name, value) tuple, when it's a list, an
+    item is a list element.
+
+    Raises ValueError when the input is not valid JSON.
+    """
+    buf = _TextBuffer(chunks)
+    buf.expect('{')
+    if buf.peek() == '}':
+        return
+    while True:
+        name = buf.value()
+        buf.expect(':')
+        if name == 'feedback' and buf.peek() in ('{', '['):
+            for item in _iter_container(buf):
+                yield ITEM, item
+        else:
+            yield MEMBER, (name, buf.value())
+        if buf.expect(',}') == '}':
+            return
+
+
+def _iter_container(buf):
+    closing = ']' if buf.expect('{[') == '[' else '}'
+    if buf.peek() == closing:
+        buf.pos += 1
+        return
+    while True:
+        if closing == '}':
+            name = buf.value()
+            buf.expect(':')
+            yield name, buf.value()
+        else:
+            yield buf.value()
+        if buf.expect(',' + closing) == closing:
+            return
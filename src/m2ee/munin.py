@@ -87,8 +87,8 @@ default_stats = {
 
 def print_config(m2, name):
     stats, java_version = get_stats('config', m2)
+    options = m2.config.get_munin_options()
     if stats is not None:
-        options = m2.config.get_munin_options()
         print_requests_config(name, stats)
         print_connectionbus_config(name, m2, stats)
         print_sessions_config(name, stats, options.get('graph_total_named_users', True))
@@ -97,6 +97,8 @@ def print_config(m2, name):
         print_cache_config(name, stats)
         print_jvm_threads_config(name, stats)
         print_jvm_process_memory_config(name)
+    if options.get('graph_admin_latency', False):
+        print_admin_latency_config(name)
     if m2.config.is_using_postgresql():
         print_pg_stat_database_config(name)
         print_pg_stat_activity_config(name)
@@ -105,8 +107,8 @@ def print_config(m2, name):
 
 def print_values(m2, name):
     stats, java_version = get_stats('values', m2)
+    options = m2.config.get_munin_options()
     if stats is not None:
-        options = m2.config.get_munin_options()
         print_requests_values(name, stats)
         print_connectionbus_values(name, stats)
         print_sessions_values(name, stats, options.get('graph_total_named_users', True))
@@ -115,6 +117,8 @@ def print_values(m2, name):
         print_cache_values(name, stats)
         print_jvm_threads_values(name, stats)
         print_jvm_process_memory_values(name, stats, m2.runner.get_pid(), java_version)
+    if options.get('graph_admin_latency', False):
+        print_admin_latency_values(name, m2.client.request_statistics)
     if m2.config.is_using_postgresql():
         db_stats = get_db_stats(m2)
         print_pg_stat_database_values(name, db_stats['pg_stat_database'])
@@ -123,8 +127,9 @@ def print_values(m2, name):
         print_pg_table_index_size_values(name, *db_stats['pg_table_index_size'])
 
 
-def guess_java_version(m2, runtime_version, stats):
-    about = m2.client.about(timeout=5)
+def guess_java_version(m2, runtime_version, stats, about=None):
+    if about is None:
+        about = m2.client.about(timeout=5)
     if 'java_version' in about:
         java_version = about['java_version']
         java_major, java_minor, _ = java_version.split('.')
@@ -173,20 +178,43 @@ def get_last_known_good_or_fake_stats(config_cache):
 def get_stats_from_runtime(m2):
     stats = {}
     logger.debug("trying to fetch runtime/server statistics")
-    stats.update(m2.client.runtime_statistics(timeout=5))
-    stats.update(m2.client.server_statistics(timeout=5))
-    if type(stats['requests']) == list:
-        # convert back to normal, whraagh
-        bork = {}
-        for x in stats['requests']:
-            bork[x['name']] = x['value']
-        stats['requests'] = bork
-
     runtime_version = m2.config.get_runtime_version()
+    # These requests are independent of each other, so fire them all at once
+    # and share a single timeout.
+    actions = [
+        ("runtime_statistics", None),
+        ("server_statistics", None),
+        ("about", None),
+    ]
     if runtime_version is not None and runtime_version >= 3.2:
-        stats['threads'] = len(m2.client.get_all_thread_stack_traces(timeout=5))
+        actions.append(("get_all_thread_stack_traces", None))
+    results = m2.client.request_many(actions, timeout=5,
+                                     stream=("get_all_thread_stack_traces",))
+    try:
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        stats.update(results[0])
+        stats.update(results[1])
+        about = results[2]
+        if type(stats['requests']) == list:
+            # convert back to normal, whraagh
+            bork = {}
+            for x in stats['requests']:
+                bork[x['name']] = x['value']
+            stats['requests'] = bork
+
+        if len(results) > 3:
+            # Only count them, without keeping all stack traces in memory.
+            stats['threads'] = sum(1 for _ in results[3])
+    finally:
+        # The streamed thread dump keeps its connection open until it's
+        # consumed completely or closed.
+        if len(results) > 3 and not isinstance(results[3], Exception):
+            results[3].close()
 
-    java_version = guess_java_version(m2, runtime_version, stats)
+    java_version = guess_java_version(m2, runtime_version, stats, about)
     if 'memorypools' in stats['memory']:
         memorypools = stats['memory']['memorypools']
         if java_version == 7:
@@ -542,6 +570,39 @@ def print_jvm_process_memory_values(name, stats, pid, java_version):
     print("")
 
 
+# Admin API requests done by get_stats_from_runtime
+admin_latency_actions = (
+    'runtime_statistics',
+    'server_statistics',
+    'about',
+    'get_all_thread_stack_traces',
+)
+
+
+def print_admin_latency_config(name):
+    print("multigraph mxruntime_admin_latency_%s" % name)
+    print("graph_args --base 1000 -l 0")
+    print("graph_vlabel milliseconds")
+    print("graph_title %s - Admin API latency" % name)
+    print("graph_category Mendix")
+    print("graph_info This graph shows how long the admin API requests done by this "
+          "plugin since the previous poll took to complete on average. Answers that "
+          "were served from the admin API feedback cache are not included.")
+    for action in admin_latency_actions:
+        print("%s.label %s" % (action, action))
+        print("%s.draw LINE1" % action)
+        print("%s.info Response time of the %s admin API request" % (action, action))
+    print("")
+
+
+def print_admin_latency_values(name, request_statistics):
+    print("multigraph mxruntime_admin_latency_%s" % name)
+    for action in admin_latency_actions:
+        mean = request_statistics.interval_mean(action)
+        print("%s.value %s" % (action, 'U' if mean is None else round(mean * 1000, 1)))
+    print("")
+
+
 def get_db_stats(m2):
     logger.debug("Retrieving database statistics.")
     stats = {}
@@ -18,7 +18,22 @@ STATE_UNKNOWN = 3
 STATE_DEPENDENT = 4
 
 
-def check(runner, client):
+def check(runner, client, options=None):
+    if options is None:
+        options = {}
+    # All checks share a single time budget, so that the plugin answers before
+    # the monitoring system gives up on it. If the admin API times out once,
+    # the remaining checks don't wait for it again, but fail immediately.
+    with client.deadline(options.get('timeout', 25)):
+        state, message, loglines = _check(runner, client)
+
+    print(message)
+    if loglines is not None:
+        print('\n'.join(loglines))
+    return state
+
+
+def _check(runner, client):
     process_state, process_message = check_process(runner, client)
     logger.trace("check_process: %s, %s" % (process_state, process_message))
 
@@ -49,10 +64,7 @@ def check(runner, client):
         if state != STATE_CRITICAL:
             state = license_state
 
-    print(message)
-    if loglines is not None:
-        print('\n'.join(loglines))
-    return state
+    return state, message, loglines
 
 
 def check_process(runner, client):
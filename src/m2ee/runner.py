@@ -2,9 +2,11 @@
 # Copyright (C) 2009 Mendix. All rights reserved.
 #
 
+import collections
 import logging
 import subprocess
 import os
+import select
 import signal
 import time
 import errno
@@ -16,6 +18,123 @@ from m2ee.exceptions import M2EEException
 logger = logging.getLogger(__name__)
 
 
+def pidfd_open(pid):
+    """
+    Returns a file descriptor that becomes readable as soon as process pid
+    exits, or None when the platform does not support this (Linux < 5.3 or
+    python < 3.9).
+    """
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError as e:
+        logger.trace("pidfd_open for pid %s failed: %s" % (pid, e))
+        return None
+
+
+def wait_for_exit(pidfd, timeout):
+    """
+    Block for at most timeout seconds, returning early when the process
+    behind pidfd exits. Returns True if the process has exited. Without a
+    pidfd, simply sleep, and return False.
+    """
+    if pidfd is None:
+        sleep(timeout)
+        return False
+    poller = select.poll()
+    poller.register(pidfd, select.POLLIN)
+    return len(poller.poll(timeout * 1000)) > 0
+
+
+class OutputTail:
+    """
+    Keeps the last max_bytes bytes of output of a process in memory, which is
+    decoded as UTF-8 when it's asked for. When spill_file is set, all output
+    is also written to that file, which is rotated when it would grow beyond
+    spill_max_bytes, keeping spill_count old copies as spill_file.1,
+    spill_file.2, etc.
+    """
+
+    def __init__(self, max_bytes=65536, spill_file=None, spill_max_bytes=10485760,
+                 spill_count=5):
+        self.max_bytes = max_bytes
+        self._chunks = collections.deque()
+        self._size = 0
+        self.dropped = 0
+        self._spill_file = spill_file
+        self._spill_max_bytes = spill_max_bytes
+        self._spill_count = spill_count
+        self._spill = None
+        self._spill_size = 0
+
+    def write(self, data):
+        self._write_spill(data)
+        if not data:
+            return
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            excess = self._size - self.max_bytes
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                dropped = len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                dropped = excess
+            self._size -= dropped
+            self.dropped += dropped
+
+    def getvalue(self):
+        data = b''.join(self._chunks)
+        dropped = self.dropped
+        if dropped > 0:
+            # Don't start halfway a multi-byte UTF-8 character.
+            start = 0
+            while start < min(len(data), 3) and 0x80 <= data[start] < 0xc0:
+                start += 1
+            data = data[start:]
+            dropped += start
+        output = data.decode('utf-8', errors='replace')
+        if dropped > 0:
+            output = "[%s earlier bytes of output omitted]\n%s" % (dropped, output)
+        return output
+
+    def _write_spill(self, data):
+        if self._spill_file is None:
+            return
+        try:
+            if self._spill is None:
+                self._spill = open(self._spill_file, 'ab')
+                self._spill_size = self._spill.tell()
+            if self._spill_size > 0 and self._spill_size + len(data) > self._spill_max_bytes:
+                self._rotate_spill()
+            self._spill.write(data)
+            self._spill.flush()
+            self._spill_size += len(data)
+        except (IOError, OSError) as e:
+            logger.warning("Cannot write startup output to %s: %s" % (self._spill_file, e))
+            self.close()
+            self._spill_file = None
+
+    def _rotate_spill(self):
+        self._spill.close()
+        for i in range(self._spill_count - 1, 0, -1):
+            older = "%s.%s" % (self._spill_file, i)
+            if os.path.exists(older):
+                os.rename(older, "%s.%s" % (self._spill_file, i + 1))
+        if self._spill_count > 0:
+            os.rename(self._spill_file, "%s.1" % self._spill_file)
+        self._spill = open(self._spill_file, 'wb')
+        self._spill_size = 0
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
 class M2EERunner:
     # for background documentation, see:
     # http://www.faqs.org/faqs/unix-faq/programmer/faq/
@@ -23,6 +142,12 @@ class M2EERunner:
     def __init__(self, config, client):
         self._config = config
         self._client = client
+        # When supported, we hold on to a pidfd for the JVM process. Other
+        # than the pid itself, it can never point to another process that
+        # happens to get the same pid later, and it can be used to wait for
+        # the process to exit.
+        self._pidfd = None
+        self._pidfd_pid = None
         self._read_pidfile()
         self._attached_proc = None
 
@@ -51,6 +176,8 @@ class M2EERunner:
     def cleanup_pid(self):
         logger.debug("cleaning up pid & pidfile")
         self._pid = None
+        self._close_pidfd()
+        self._client.invalidate_cache()
         pidfile = self._config.get_pidfile()
         if os.path.isfile(pidfile):
             os.unlink(pidfile)
@@ -60,12 +187,66 @@ class M2EERunner:
             self._read_pidfile()
         return self._pid
 
+    def close(self):
+        """
+        Release the pidfd of the application process, if we have one. The
+        runner can still be used afterwards.
+        """
+        self._close_pidfd()
+
+    def reread_pid(self):
+        """
+        Forget the pid that was read before, and read the pidfile again. Long
+        running processes, like the supervisor, use this to notice that the
+        application was started or stopped by someone else.
+        """
+        self._pid = None
+        return self.get_pid()
+
+    def _get_pidfd(self):
+        pid = self.get_pid()
+        if pid is None:
+            return None
+        if self._pidfd_pid != pid:
+            self._close_pidfd()
+            self._pidfd = pidfd_open(pid)
+            self._pidfd_pid = pid
+        return self._pidfd
+
+    def _close_pidfd(self):
+        if self._pidfd is not None:
+            os.close(self._pidfd)
+        self._pidfd = None
+        self._pidfd_pid = None
+
+    def _send_signal(self, sig):
+        pidfd = self._get_pidfd()
+        if pidfd is not None:
+            signal.pidfd_send_signal(pidfd, sig)
+        else:
+            os.kill(self._pid, sig)
+
     def check_pid(self, pid=None):
         if pid is None:
             pid = self.get_pid()
         if pid is None:
             logger.trace("No pid available.")
             return False
+        if pid == self._pid:
+            pidfd = self._get_pidfd()
+            if pidfd is not None:
+                # A pidfd becomes readable as soon as the process exits, even
+                # when it's not reaped yet by its parent.
+                if wait_for_exit(pidfd, 0):
+                    logger.trace("Process with pid %s has exited." % pid)
+                    return False
+                try:
+                    signal.pidfd_send_signal(pidfd, 0)
+                    logger.trace("pid %s is alive!" % pid)
+                    return True
+                except OSError:
+                    logger.trace("No process with pid %s, or not ours." % pid)
+                    return False
         try:
             os.kill(pid, 0)  # doesn't actually kill process
             logger.trace("pid %s is alive!" % pid)
@@ -74,6 +255,29 @@ class M2EERunner:
             logger.trace("No process with pid %s, or not ours." % pid)
             return False
 
+    def wait(self, timeout, wakeup_fd=None):
+        """
+        Block for at most timeout seconds, returning early when the JVM
+        process exits, or when wakeup_fd becomes readable. Returns True if
+        the JVM process is not running (any more).
+        """
+        poller = select.poll()
+        if wakeup_fd is not None:
+            poller.register(wakeup_fd, select.POLLIN)
+        pidfd = self._get_pidfd() if self.check_pid() else None
+        if pidfd is not None:
+            poller.register(pidfd, select.POLLIN)
+            poller.poll(timeout * 1000)
+        else:
+            # Without pidfd, look at the process once a second.
+            deadline = time.monotonic() + timeout
+            while self.check_pid():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or len(poller.poll(min(remaining, 1) * 1000)) > 0:
+                    break
+        self.check_attached_proc()
+        return not self.check_pid()
+
     def check_attached_proc(self):
         if self._attached_proc is None:
             return False
@@ -98,7 +302,7 @@ class M2EERunner:
     def terminate(self, timeout):
         logger.debug("sending SIGTERM to pid %s" % self._pid)
         try:
-            os.kill(self._pid, signal.SIGTERM)
+            self._send_signal(signal.SIGTERM)
         except OSError:
             # already gone or not our process?
             logger.debug("OSError! Process already gone?")
@@ -107,17 +311,18 @@ class M2EERunner:
     def kill(self, timeout):
         logger.debug("sending SIGKILL to pid %s" % self._pid)
         try:
-            os.kill(self._pid, signal.SIGKILL)
+            self._send_signal(signal.SIGKILL)
         except OSError:
             # already gone or not our process?
             logger.debug("OSError! Process already gone?")
         return self._wait_pid(timeout)
 
-    def start(self, detach=True, timeout=60, step=0.25):
+    def start(self, detach=True, timeout=60, step=0.25, profile=None):
         if self.check_pid():
             logger.error("The application process is already started!")
             return
 
+        self._client.invalidate_cache()
         if detach:
             pipe_r, pipe_w = os.pipe()
             try:
@@ -126,30 +331,43 @@ class M2EERunner:
             except OSError as e:
                 raise M2EEException("Forking subprocess failed: %d (%s)\n" % (e.errno, e.strerror))
             if pid > 0:
+                if profile is not None:
+                    profile.mark('fork')
                 self._pid = None
                 os.close(pipe_w)
                 fcntl.fcntl(pipe_r, fcntl.F_SETFL,
                             fcntl.fcntl(pipe_r, fcntl.F_GETFL) | os.O_NONBLOCK)
                 logger.trace("[%s] Waiting for intermediate process to exit..." % os.getpid())
                 interactive = sys.stderr.isatty()
-                pipe_fragments = []
+                output_tail = OutputTail(
+                    max_bytes=self._config.get_start_output_tail(),
+                    spill_file=self._config.get_start_output_file(),
+                    spill_max_bytes=self._config.get_start_output_file_max_bytes(),
+                    spill_count=self._config.get_start_output_file_count())
+                # Wake up as soon as there's output, or the intermediate
+                # process exits. Without pidfd support, fall back to checking
+                # for the latter every step seconds.
+                pidfd = pidfd_open(pid)
+                poller = select.poll()
+                poller.register(pipe_r, select.POLLIN)
+                if pidfd is not None:
+                    poller.register(pidfd, select.POLLIN)
                 child, result = 0, 0
                 while child == 0:
-                    sleep(step)
+                    for fd, event in poller.poll(None if pidfd is not None else step * 1000):
+                        if fd == pipe_r and not self._read_pipe(pipe_r, output_tail,
+                                                                interactive):
+                            # All writers are gone, stop polling for it.
+                            poller.unregister(pipe_r)
                     child, result = os.waitpid(pid, os.WNOHANG)
-                    if child != 0:
-                        os.close(pipe_r)
-                    while True:
-                        try:
-                            pipe_fragment = os.read(pipe_r, 1024)
-                            if interactive:
-                                os.write(2, pipe_fragment)
-                            pipe_fragments.append(pipe_fragment)
-                        except OSError:
-                            break
-                pipe_bytes = b''.join(pipe_fragments)
-                output = pipe_bytes.decode('utf-8')
+                if pidfd is not None:
+                    os.close(pidfd)
+                self._read_pipe(pipe_r, output_tail, interactive)
+                os.close(pipe_r)
+                output_tail.close()
+                output = output_tail.getvalue()
                 exitcode = result >> 8
+                self._profile_jvm_start(profile, exitcode)
                 self._handle_jvm_start_result(exitcode, output)
                 return
             logger.trace("[%s] Now in intermediate forked process..." % os.getpid())
@@ -165,8 +383,39 @@ class M2EERunner:
             os._exit(exitcode)
         else:
             exitcode = self._start_jvm(detach, timeout, step)
+            self._profile_jvm_start(profile, exitcode)
             self._handle_jvm_start_result(exitcode)
 
+    def _profile_jvm_start(self, profile, exitcode):
+        if profile is None:
+            return
+        # The pidfile is written right after the JVM process was exec'd, by
+        # the intermediate process in case of detaching.
+        try:
+            exec_time = os.stat(self._config.get_pidfile()).st_mtime
+            if exec_time >= profile.started:
+                profile.mark('exec', exec_time)
+        except OSError:
+            pass
+        if exitcode == 0:
+            profile.mark('admin_api')
+
+    def _read_pipe(self, pipe_r, output_tail, interactive):
+        """
+        Read all output that is available in the non-blocking pipe_r. Returns
+        False when the write end of the pipe has been closed.
+        """
+        while True:
+            try:
+                pipe_fragment = os.read(pipe_r, 65536)
+            except OSError:
+                return True
+            if pipe_fragment == b'':
+                return False
+            if interactive:
+                os.write(2, pipe_fragment)
+            output_tail.write(pipe_fragment)
+
     def _handle_jvm_start_result(self, exitcode, output=None):
         if exitcode == 0:
             logger.debug("The JVM process has been started.")
@@ -251,20 +500,37 @@ class M2EERunner:
         self._pid = proc.pid
         logger.trace("[%s] Writing JVM pid to pidfile: %s" % (os.getpid(), self._pid))
         self._write_pidfile()
-        # wait for m2ee to become available
-        t = 0
-        while t < timeout:
-            sleep(step)
-            dead = proc.poll()
-            if dead is not None:
-                logger.debug("Java subprocess terminated with errorcode %s" % dead)
-                return 0x20 + dead
-            if self.check_pid(proc.pid) and self._client.ping():
-                break
-            t += step
+        # Wait for m2ee to become available. There's no way to get notified
+        # when the admin API starts listening, so we have to probe it. A probe
+        # while nothing listens yet is only a refused connection attempt, so
+        # we can afford to do that often, starting at 10ms and backing off to
+        # at most 50ms. In between, we wake up immediately when the JVM
+        # process dies.
+        deadline = time.monotonic() + timeout
+        max_interval = min(0.05, step)
+        interval = min(0.01, max_interval)
+        pidfd = pidfd_open(proc.pid)
+        try:
+            while True:
+                dead = proc.poll()
+                if dead is not None:
+                    logger.debug("Java subprocess terminated with errorcode %s" % dead)
+                    return 0x20 + dead
+                if self._client.ping():
+                    timed_out = False
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                wait_for_exit(pidfd, min(interval, remaining))
+                interval = min(interval * 2, max_interval)
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
         if not detach:
             self._attached_proc = proc
-        if t >= timeout:
+        if timed_out:
             logger.debug("Timeout: Java subprocess takes too long to start.")
             return 4
         return 0
@@ -274,15 +540,23 @@ class M2EERunner:
         if self.check_pid():
             if timeout is None:
                 return False
-            t = 0
-            while t < timeout:
-                sleep(step)
-                alive = self.check_pid()
+            pidfd = self._get_pidfd()
+            if pidfd is not None:
+                exited = wait_for_exit(pidfd, timeout)
+                # When running attached, the JVM process is our own child,
+                # which has to be reaped.
                 self.check_attached_proc()
-                if not alive:
-                    break
-                t += step
-            if t >= timeout:
+            else:
+                t = 0
+                while t < timeout:
+                    sleep(step)
+                    alive = self.check_pid()
+                    self.check_attached_proc()
+                    if not alive:
+                        break
+                    t += step
+                exited = t < timeout
+            if not exited:
                 logger.trace("Timeout: Process %s takes too long to "
                              "disappear." % self._pid)
                 return False
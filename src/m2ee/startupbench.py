@@ -0,0 +1,113 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Measure how long starting m2ee for a single command takes, the way munin-node
+and nagios run it, using the import time report of python -X importtime.
+Every run is a new python process, so this includes everything that happens
+before the command itself does something.
+
+    python -m m2ee.startupbench -c /etc/m2ee/m2ee.yaml munin_values nagios status
+
+With --threshold, the exit status is 1 if, for any of the commands, the median
+time spent importing modules is higher than the threshold in milliseconds, so
+that it can be used to catch regressions.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+
+def parse_importtime(output):
+    """
+    Returns a list of (module name, nesting level, cumulative import time in
+    microseconds), and the total import time, for the stderr output of
+    python -X importtime.
+    """
+    modules = []
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), level, int(cumulative)))
+        # Nested imports are included in the time of their parents.
+        if level == 0:
+            total += int(cumulative)
+    return modules, total
+
+
+def run(cli, yaml_files, command):
+    """
+    Run m2ee once for command, returns (wall time, import times, total import
+    time), in seconds and microseconds.
+    """
+    cmd = [sys.executable, '-X', 'importtime', cli, '-qq']
+    for yaml_file in yaml_files:
+        cmd.extend(['-c', yaml_file])
+    cmd.extend(command.split())
+    started = time.monotonic()
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    wall = time.monotonic() - started
+    modules, total = parse_importtime(proc.stderr)
+    return wall, modules, total
+
+
+def find_cli():
+    source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'm2ee.py')
+    if os.path.isfile(source):
+        return source
+    return shutil.which('m2ee')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure startup time of one-shot m2ee commands")
+    parser.add_argument("-c", action="append", default=[], dest="yaml_files")
+    parser.add_argument("--cli", default=find_cli(), help="m2ee program to run")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10,
+                        help="show the modules that take the most time to import")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help="fail if the median import time of a command is higher, in ms",
+    )
+    parser.add_argument("commands", nargs='*',
+                        default=['munin_values', 'nagios', 'status'])
+    args = parser.parse_args()
+    if args.cli is None:
+        parser.error("Unable to find m2ee, use --cli")
+
+    failed = False
+    for command in args.commands:
+        # The first run fills the configuration cache, and the page cache.
+        run(args.cli, args.yaml_files, command)
+        results = [run(args.cli, args.yaml_files, command) for _ in range(args.runs)]
+        wall = statistics.median(result[0] for result in results) * 1000
+        imports = statistics.median(result[2] for result in results) / 1000
+        modules = results[-1][1]
+        print("%-16s wall %7.1f ms  imports %7.1f ms  %4d modules" %
+              (command, wall, imports, len(modules)))
+        slowest = sorted(((cumulative, name) for name, level, cumulative in modules
+                          if level == 0 or name.startswith('m2ee')),
+                         reverse=True)
+        for cumulative, name in slowest[:args.top]:
+            print("    %7.1f ms  %s" % (cumulative / 1000, name))
+        if args.threshold is not None and imports > args.threshold:
+            print("    import time is above the threshold of %.1f ms" % args.threshold)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
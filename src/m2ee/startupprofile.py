@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """
+    Records at which moment each phase of starting the application ended,
+    relative to the moment the start began.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = []
+        self.result = None
+
+    def mark(self, phase, timestamp=None):
+        """
+        Record that phase ended now, or at timestamp, which is a time.time()
+        value.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        offset = max(timestamp - self.started, 0)
+        logger.trace("Startup phase %s done after %.3fs" % (phase, offset))
+        self.phases.append([phase, offset])
+
+    def finish(self, result):
+        self.result = result
+
+    def durations(self):
+        """
+        Returns a list of (phase, seconds) tuples.
+        """
+        durations = []
+        previous = 0
+        for phase, offset in self.phases:
+            durations.append((phase, offset - previous))
+            previous = offset
+        return durations
+
+    def total(self):
+        return self.phases[-1][1] if self.phases else 0
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'result': self.result,
+            'phases': self.phases,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls()
+        profile.started = data['started']
+        profile.result = data.get('result', None)
+        profile.phases = data['phases']
+        return profile
+
+
+def read_profiles(filename):
+    """
+    Returns the list of profiles that is stored in filename, oldest first.
+    """
+    if not os.path.isfile(filename):
+        return []
+    try:
+        with open(filename) as f:
+            return [StartupProfile.from_dict(data) for data in json.load(f)]
+    except IOError as e:
+        logger.error("Error reading startup profiles from %s: %s" % (filename, e))
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error("Error parsing startup profiles file %s: %s" % (filename, e))
+    return []
+
+
+def write_profile(profile, filename, history):
+    """
+    Add profile to the file, keeping at most history profiles in there.
+    """
+    profiles = read_profiles(filename)
+    profiles.append(profile)
+    profiles = profiles[-history:] if history > 0 else []
+    logger.debug("Writing startup profile to %s" % filename)
+    try:
+        with open(filename + '.tmp', 'w') as f:
+            json.dump([p.to_dict() for p in profiles], f)
+        os.rename(filename + '.tmp', filename)
+    except (IOError, OSError) as e:
+        logger.error("Error writing startup profiles to %s: %s" % (filename, e))
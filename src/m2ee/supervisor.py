@@ -0,0 +1,251 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import fcntl
+import logging
+import os
+import select
+import signal
+import time
+
+from m2ee.client import M2EEAdminException, M2EEAdminHTTPException, \
+        M2EEAdminNotAvailable, M2EEAdminTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class Supervisor:
+    """
+    Keeps the application running: restarts it after the JVM process died,
+    or after it stopped answering admin API pings, with exponential backoff
+    between restarts that follow each other quickly.
+
+    While the application is healthy, the supervisor sleeps in poll() on a
+    pidfd of the JVM process, only waking up to send a ping every
+    ping_interval seconds.
+    """
+
+    def __init__(self, m2ee, start, options):
+        self._m2ee = m2ee
+        self._start = start
+        self._ping_interval = options.get('ping_interval', 10)
+        self._ping_timeout = options.get('ping_timeout', 5)
+        self._max_failed_pings = options.get('max_failed_pings', 3)
+        self._backoff_initial = options.get('backoff_initial', 5)
+        self._backoff_max = options.get('backoff_max', 300)
+        self._backoff_reset = options.get('backoff_reset', 600)
+        self._report_path = options['report_path']
+        self._report_count = options.get('report_count', 10)
+        self._log_tail = options.get('log_tail', 65536)
+        self._stopping = False
+        self._restarts = 0
+        self._wakeup_r = None
+
+    def run(self):
+        """
+        Supervise the application until SIGTERM or SIGINT is received.
+        """
+        self._wakeup_r, wakeup_w = os.pipe()
+        for fd in (self._wakeup_r, wakeup_w):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        previous_wakeup_fd = signal.set_wakeup_fd(wakeup_w)
+        previous_handlers = dict(
+            (signum, signal.signal(signum, self._handle_signal))
+            for signum in (signal.SIGTERM, signal.SIGINT))
+        logger.info("Supervising the application, pinging it every %ss..." %
+                    self._ping_interval)
+        try:
+            self._supervise()
+        finally:
+            signal.set_wakeup_fd(previous_wakeup_fd)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            os.close(self._wakeup_r)
+            os.close(wakeup_w)
+            self._wakeup_r = None
+        logger.info("Stopped supervising the application, leaving it as it is.")
+
+    def _handle_signal(self, signum, frame):
+        logger.info("Received signal %s, stopping the supervisor." % signum)
+        self._stopping = True
+
+    def _supervise(self):
+        failed_pings = 0
+        running_since = None
+        # Only when the application is not running at all when we begin, it
+        # is started right away. After that, a pidfile that disappeared means
+        # that the application was stopped on purpose, e.g. for maintenance.
+        first = True
+        stopped = False
+        while not self._stopping:
+            self._m2ee.reload_config_if_changed()
+            runner = self._m2ee.runner
+            # Someone else may have restarted the application in the meantime,
+            # which replaces the pid in the pidfile.
+            runner.reread_pid()
+            if not runner.check_pid():
+                running_since = None
+                failed_pings = 0
+                with self._m2ee.lifecycle_lock(wait=False) as locked:
+                    if not locked:
+                        self._wait_for_operation()
+                        continue
+                    # Look again now that a start or stop that just finished
+                    # can not interfere.
+                    pid = runner.get_pid()
+                    if runner.check_pid():
+                        continue
+                    if pid is not None:
+                        if not first:
+                            logger.error("The application process has disappeared.")
+                            self._write_report("The JVM process has exited.")
+                        runner.cleanup_pid()
+                    elif not first:
+                        if not stopped:
+                            logger.info("The application has been stopped by another m2ee "
+                                        "process, waiting for it to be started again.")
+                            stopped = True
+                        self._sleep(self._ping_interval)
+                        continue
+                first = False
+                stopped = False
+                self._restart()
+                continue
+
+            if stopped:
+                logger.info("The application has been started again.")
+                stopped = False
+            first = False
+            if running_since is None:
+                running_since = time.monotonic()
+            if self._restarts > 0 and time.monotonic() - running_since > self._backoff_reset:
+                logger.debug("The application has been running for %ss, resetting "
+                             "restart backoff." % self._backoff_reset)
+                self._restarts = 0
+
+            if self._m2ee.client.ping(timeout=self._ping_timeout):
+                if failed_pings > 0:
+                    logger.info("The application responds to pings again.")
+                failed_pings = 0
+            else:
+                failed_pings += 1
+                logger.warning("The application did not respond to a ping (%s of %s)." %
+                               (failed_pings, self._max_failed_pings))
+                if failed_pings >= self._max_failed_pings:
+                    running_since = None
+                    failed_pings = 0
+                    with self._m2ee.lifecycle_lock(wait=False) as locked:
+                        if not locked:
+                            # Not responding while it's being started or
+                            # stopped is expected.
+                            self._wait_for_operation()
+                            continue
+                        if not runner.check_pid():
+                            continue
+                        logger.error("The application stopped responding, "
+                                     "restarting it.")
+                        self._write_report("The application did not respond to %s "
+                                           "pings in a row." % self._max_failed_pings,
+                                           thread_dump=True)
+                        if not self._m2ee.terminate():
+                            self._m2ee.kill()
+                    # Terminating it removed the pidfile, so it has to be
+                    # started here, instead of after noticing it's gone.
+                    self._restart()
+                    continue
+
+            runner.wait(self._ping_interval, self._wakeup_r)
+            self._drain_wakeup()
+
+    def _wait_for_operation(self):
+        logger.info("The application is being started or stopped by another m2ee "
+                    "process, waiting for that to finish.")
+        self._sleep(self._ping_interval)
+
+    def _restart(self):
+        if self._restarts > 0:
+            delay = min(self._backoff_initial * 2 ** (self._restarts - 1), self._backoff_max)
+            logger.info("Waiting %ss before restarting the application..." % delay)
+            self._sleep(delay)
+            if self._stopping:
+                return
+        self._restarts += 1
+        logger.info("Starting the application (attempt %s)..." % self._restarts)
+        try:
+            self._start()
+        except Exception as e:
+            logger.error("Starting the application failed: %s" % e)
+
+    def _sleep(self, seconds):
+        deadline = time.monotonic() + seconds
+        while not self._stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            select.select([self._wakeup_r], [], [], remaining)
+            self._drain_wakeup()
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except OSError:
+            pass
+
+    def _write_report(self, reason, thread_dump=False):
+        """
+        Save the end of the application log file and, if possible, a thread
+        dump, to look at after the restart.
+        """
+        if not os.path.isdir(self._report_path):
+            try:
+                os.makedirs(self._report_path)
+            except OSError as e:
+                logger.error("Cannot create crash report directory %s: %s" %
+                             (self._report_path, e))
+                return
+        filename = os.path.join(self._report_path, "crash-%s.txt" %
+                                time.strftime("%Y%m%d_%H%M%S"))
+        lines = ["%s %s" % (time.strftime("%Y-%m-%d %H:%M:%S"), reason), ""]
+        if thread_dump:
+            lines.extend(self._thread_dump())
+        lines.extend(self._log_file_tail())
+        try:
+            with open(filename, 'w') as f:
+                f.write('\n'.join(lines))
+                f.write('\n')
+            logger.info("Saved crash report to %s" % filename)
+        except IOError as e:
+            logger.error("Cannot write crash report %s: %s" % (filename, e))
+        reports = sorted(name for name in os.listdir(self._report_path)
+                         if name.startswith('crash-') and name.endswith('.txt'))
+        for name in reports[:-self._report_count] if self._report_count > 0 else reports:
+            os.unlink(os.path.join(self._report_path, name))
+
+    def _thread_dump(self):
+        try:
+            threads = self._m2ee.client.get_all_thread_stack_traces(
+                timeout=self._ping_timeout)
+        except (M2EEAdminException, M2EEAdminHTTPException, M2EEAdminNotAvailable,
+                M2EEAdminTimeout) as e:
+            return ["Thread dump not available: %s" % e, ""]
+        lines = ["Thread dump:"]
+        for name, frames in threads.items():
+            lines.append(name)
+            lines.extend("    %s" % frame for frame in frames)
+        lines.append("")
+        return lines
+
+    def _log_file_tail(self):
+        logfile = self._m2ee.config.get_logfile()
+        if logfile is None:
+            return ["No logfile configured, no log output available."]
+        try:
+            with open(logfile, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - self._log_tail, 0))
+                tail = f.read().decode('utf-8', 'replace')
+        except IOError as e:
+            return ["Cannot read logfile %s: %s" % (logfile, e)]
+        return ["Last %s bytes of %s:" % (self._log_tail, logfile), tail]
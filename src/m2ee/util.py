@@ -8,20 +8,25 @@ import shutil
 import subprocess
 import sys
 import tempfile
-import zipfile
 from m2ee.exceptions import M2EEException
 from m2ee.version import MXVersion
 
 logger = logging.getLogger(__name__)
 
-try:
-    import readline
-    # allow - in filenames we're completing without messing up completion
-    readline.set_completer_delims(
-        readline.get_completer_delims().replace('-', '')
-    )
-except ImportError:
-    pass
+
+def setup_readline():
+    """
+    Prepare tab completion for the interactive shell. Not done on import,
+    since importing readline is wasted time for one-shot commands.
+    """
+    try:
+        import readline
+        # allow - in filenames we're completing without messing up completion
+        readline.set_completer_delims(
+            readline.get_completer_delims().replace('-', '')
+        )
+    except ImportError:
+        pass
 
 
 def unpack(config, mda_name):
@@ -37,6 +42,7 @@ def unpack(config, mda_name):
     shutil.rmtree(os.path.join(app_base, 'model'), ignore_errors=True)
     shutil.rmtree(os.path.join(app_base, 'web'), ignore_errors=True)
 
+    import zipfile
     logger.info("Extracting archive '%s'..." % mda_name)
     try:
         z = zipfile.ZipFile(mda_file_name, 'r')
@@ -177,3 +183,25 @@ def cleanup_runtimes_except(versions, runtimes_path):
         full_path = os.path.join(runtimes_path, item_to_remove)
         logger.info("Removing %s..." % item_to_remove)
         shutil.rmtree(full_path, ignore_errors=True)
+
+
+def write_file_atomically(filename, content):
+    """
+    Replace the contents of filename in a way that readers either see the old
+    or the new contents, never a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmpname)
+        else:
+            os.chmod(tmpname, 0o644)
+        os.rename(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
@@ -0,0 +1,164 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+"""
+Send a configurable set of HTTP requests to the runtime port right after
+starting, so the JIT compiler and caches are warm before real users arrive.
+"""
+
+import http.client
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUpRequest:
+
+    def __init__(self, spec):
+        if isinstance(spec, dict):
+            self.method = spec.get('method', 'GET')
+            self.path = spec['path']
+            self.headers = spec.get('headers', {})
+            self.body = spec.get('body', None)
+        else:
+            self.method = 'GET'
+            self.path = spec
+            self.headers = {}
+            self.body = None
+        if isinstance(self.body, str):
+            self.body = self.body.encode('utf-8')
+
+    def __str__(self):
+        return "%s %s" % (self.method, self.path)
+
+
+class WarmUpResult:
+    """
+    Latencies in seconds and error counts, per request.
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.latencies = {str(request): [] for request in requests}
+        self.errors = {str(request): 0 for request in requests}
+        self.duration = 0
+        self._lock = threading.Lock()
+
+    def add(self, request, latency, error=None):
+        with self._lock:
+            if error is None:
+                self.latencies[str(request)].append(latency)
+            else:
+                self.errors[str(request)] += 1
+                logger.debug("Warm-up request %s failed: %s" % (request, error))
+
+    def total(self):
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    def report(self):
+        """
+        Returns lines with count, errors and latency percentiles in
+        milliseconds per request.
+        """
+        lines = ["%-40s%8s%8s%10s%10s%10s%10s" % (
+            "request", "count", "errors", "min", "median", "p99", "max")]
+        for request in self.requests:
+            name = str(request)
+            latencies = sorted(self.latencies[name])
+            if latencies:
+                lines.append("%-40s%8d%8d%10.1f%10.1f%10.1f%10.1f" % (
+                    name[:39], len(latencies), self.errors[name],
+                    latencies[0] * 1000,
+                    _percentile(latencies, 50) * 1000,
+                    _percentile(latencies, 99) * 1000,
+                    latencies[-1] * 1000))
+            else:
+                lines.append("%-40s%8d%8d%10s%10s%10s%10s" % (
+                    name[:39], 0, self.errors[name], "-", "-", "-", "-"))
+        return lines
+
+
+def _percentile(values, percentile):
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def runtime_host(listen_addresses):
+    """
+    Returns an address from the runtime_listen_addresses option that we can
+    connect to.
+    """
+    for address in str(listen_addresses).split(','):
+        address = address.strip()
+        if address in ('', '*', '0.0.0.0'):
+            return '127.0.0.1'
+        if address == '::':
+            return '::1'
+        return address
+    return '127.0.0.1'
+
+
+def warm_up(host, port, request_specs, concurrency=4, duration=30, timeout=10):
+    """
+    Send the requests round robin using concurrency connections, until
+    duration seconds have passed. Returns a WarmUpResult.
+    """
+    requests = [WarmUpRequest(spec) for spec in request_specs]
+    result = WarmUpResult(requests)
+    if not requests:
+        return result
+
+    started = time.time()
+    deadline = started + duration
+    schedule = itertools.cycle(requests)
+    schedule_lock = threading.Lock()
+
+    def worker():
+        conn = None
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            with schedule_lock:
+                request = next(schedule)
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=min(timeout, remaining))
+            else:
+                conn.timeout = min(timeout, remaining)
+                if conn.sock is not None:
+                    conn.sock.settimeout(conn.timeout)
+            request_started = time.time()
+            try:
+                conn.request(request.method, request.path, body=request.body,
+                             headers=request.headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    result.add(request, None, "HTTP status %s" % response.status)
+                else:
+                    result.add(request, time.time() - request_started)
+                if response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException) as e:
+                result.add(request, None, e)
+                conn.close()
+                conn = None
+                # Don't hammer a port that is not accepting connections.
+                time.sleep(min(0.1, max(deadline - time.time(), 0)))
+        if conn is not None:
+            conn.close()
+
+    logger.info("Warming up the application for %ss using %s concurrent "
+                "connections..." % (duration, concurrency))
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.duration = time.time() - started
+    return result
@@ -0,0 +1,112 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import cmd
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from m2ee.agent import Agent
+from m2ee.client import M2EEClient
+from m2ee.runner import M2EERunner
+
+
+class FakeConfig:
+
+    def __init__(self, pidfile):
+        self._pidfile = pidfile
+
+    def get_pidfile(self):
+        return self._pidfile
+
+
+class FakeM2EE:
+
+    def __init__(self, pidfile):
+        self.client = M2EEClient('http://127.0.0.1:1/', 'secret')
+        self.runner = M2EERunner(FakeConfig(pidfile), self.client)
+        self.client.set_pid_source(self.runner.get_pid)
+
+    def reload_config_if_changed(self):
+        pass
+
+
+class FakeCLI(cmd.Cmd):
+
+    def __init__(self, m2ee):
+        super().__init__()
+        self.m2ee = m2ee
+        self.calls = 0
+
+    def do_pid(self, args):
+        pid = self.m2ee.runner.get_pid()
+        print("%s %s" % (pid, 'alive' if self.m2ee.runner.check_pid() else 'gone'))
+
+    def do_client_stats(self, args):
+        self.calls += 1
+        print(self.calls)
+
+    def oneshot(self, line):
+        self.onecmd(line)
+        return 0
+
+
+class AgentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pidfile = os.path.join(self.tmpdir, 'm2ee.pid')
+        self.procs = []
+
+    def tearDown(self):
+        for proc in self.procs:
+            proc.kill()
+            proc.wait()
+        shutil.rmtree(self.tmpdir)
+
+    def start_jvm(self):
+        proc = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        self.procs.append(proc)
+        with open(self.pidfile, 'w') as f:
+            f.write("%s\n" % proc.pid)
+        return proc
+
+    def agent(self):
+        return Agent(FakeCLI(FakeM2EE(self.pidfile)), {
+            'socket': os.path.join(self.tmpdir, 'agent.sock'),
+            'commands': ['pid', 'client_stats'],
+            'output_cache_ttl': 60,
+        })
+
+    def test_jvm_replaced_between_requests(self):
+        agent = self.agent()
+        first = self.start_jvm()
+        answer = agent._execute('pid', None)
+        self.assertEqual("%s alive\n" % first.pid, answer['stdout'])
+
+        # Restarted by another m2ee process, the agent only sees the pidfile.
+        first.kill()
+        first.wait()
+        second = self.start_jvm()
+        answer = agent._execute('pid', None)
+        self.assertEqual("%s alive\n" % second.pid, answer['stdout'])
+
+    def test_output_cache(self):
+        agent = self.agent()
+        self.start_jvm()
+        self.assertEqual(agent._execute('pid', None), agent._execute('pid', None))
+        self.assertEqual("1\n", agent._execute('client_stats', None)['stdout'])
+        self.assertEqual("2\n", agent._execute('client_stats', None)['stdout'])
+
+    def test_refused(self):
+        answer = self.agent()._execute('stop', None)
+        self.assertTrue(answer['refused'])
+        self.assertEqual(1, answer['exit'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import json
+import unittest
+
+from m2ee.jsonstream import ITEM, MEMBER, iter_response
+
+documents = [
+    '{}',
+    '{"result": 0}',
+    '{"result": 0, "feedback": [1.5, 2, -2.5e10, 0.25E-3, 1e+2, -0, 17]}',
+    '{"result": 0, "feedback": {"a": 12.75, "b": [1, 2.5, {"c": -3e-2}]}}',
+    '{"feedback": [], "result": -1}',
+    '{"feedback": {}, "result": 1.0}',
+    '{"result": 0, "feedback": [true, false, null, "café ☃", {"x": "\\u00e9\\n"}]}',
+    '{"result": 3, "message": "error", "cause": null, "feedback": 42.125}',
+    ' { "result" : 0 , "feedback" : [ 1 , 22.5 ] } ',
+]
+
+
+def parse(document, size):
+    data = document.encode('utf-8')
+    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+    result = {}
+    items = []
+    for kind, value in iter_response(chunks):
+        if kind == MEMBER:
+            result[value[0]] = value[1]
+        elif kind == ITEM:
+            items.append(value)
+    # Feedback that is a list or object is yielded one item at a time.
+    feedback = json.loads(document).get('feedback')
+    if isinstance(feedback, list):
+        result['feedback'] = items
+    elif isinstance(feedback, dict):
+        result['feedback'] = dict(items)
+    return result
+
+
+class IterResponseTest(unittest.TestCase):
+
+    def test_every_chunk_size(self):
+        for document in documents:
+            expected = json.loads(document)
+            for size in range(1, len(document.encode('utf-8')) + 1):
+                with self.subTest(document=document, size=size):
+                    self.assertEqual(expected, parse(document, size))
+
+    def test_invalid(self):
+        for document in ['{"result": 0', '{"feedback": [1.5,', '{"result": 1.}', '[]']:
+            for size in range(1, len(document) + 1):
+                with self.subTest(document=document, size=size):
+                    data = document.encode('utf-8')
+                    chunks = [data[i:i + size] for i in range(0, len(data), size)]
+                    with self.assertRaises(ValueError):
+                        list(iter_response(chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+#
+# Copyright (C) 2009 Mendix. All rights reserved.
+#
+
+import importlib
+import pkgutil
+import unittest
+
+import m2ee
+
+
+class SubmodulesTest(unittest.TestCase):
+
+    def test_all_submodules_are_listed(self):
+        names = [info.name for info in pkgutil.iter_modules(m2ee.__path__)]
+        self.assertTrue(names)
+        for name in names:
+            with self.subTest(name=name):
+                self.assertIn(name, m2ee._submodules)
+
+    def test_submodules_are_attributes(self):
+        for name in m2ee._submodules:
+            with self.subTest(name=name):
+                self.assertIs(getattr(m2ee, name),
+                              importlib.import_module('m2ee.%s' % name))
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(AttributeError):
+            m2ee.does_not_exist
+
+
+if __name__ == '__main__':
+    unittest.main()